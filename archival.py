@@ -0,0 +1,86 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+# Hot/cold tiering for reports and BMI readings.
+#
+# Documents whose _id is older than the configured age (i.e. saved before the
+# cutoff) are copied to an archive collection and then removed from the live
+# one, a batch at a time, oldest first. The copy is an upsert by _id, so a run
+# interrupted between the copy and the delete is simply finished by the next
+# one. Archive collections are created with a stronger block compressor and
+# carry only the indexes the fall-through reads need, so they cost little disk
+# and no working-set memory until a date range actually asks for old data.
+
+
+def cutoff_id(days, now=None):
+    from bson import ObjectId
+    now = now or datetime.now(timezone.utc)
+    return ObjectId.from_datetime(now - timedelta(days=days))
+
+
+# _id filter for documents saved between two dates (inclusive, either may be None)
+def id_range(date_from=None, date_to=None):
+    from bson import ObjectId
+    query = {}
+    if date_from:
+        query['$gte'] = ObjectId.from_datetime(date_from)
+    if date_to:
+        query['$lt'] = ObjectId.from_datetime(date_to + timedelta(days=1))
+    return query
+
+
+def ensure_archive_collection(db, name, indexes, block_compressor='zstd'):
+    from pymongo.errors import CollectionInvalid, OperationFailure
+
+    if name not in db.list_collection_names():
+        try:
+            db.create_collection(name, storageEngine={'wiredTiger': {'configString': f'block_compressor={block_compressor}'}})
+        except CollectionInvalid:
+            pass  # created by another process in the meantime
+        except (OperationFailure, NotImplementedError) as e:
+            print(f"Archive {name}: {block_compressor} compression unavailable, using the default: {e}")
+            db.create_collection(name)
+    collection = db[name]
+    for index in indexes:
+        collection.create_index(index)
+    return collection
+
+
+# Move documents saved before `cutoff` from `source` to `archive`.
+# Returns the number of documents moved.
+def archive_batches(source, archive, cutoff, batch_size=1000, pause=0.0, max_batches=None, on_batch=None):
+    from pymongo import ReplaceOne
+
+    moved = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        documents = list(source.find({'_id': {'$lt': cutoff}}).sort('_id', 1).limit(batch_size))
+        if not documents:
+            break
+        archive.bulk_write([ReplaceOne({'_id': d['_id']}, d, upsert=True) for d in documents], ordered=False)
+        source.delete_many({'_id': {'$in': [d['_id'] for d in documents]}})
+        moved += len(documents)
+        batches += 1
+        if on_batch:
+            on_batch(moved)
+        if pause:
+            time.sleep(pause)  # leave room for the request traffic between batches
+    return moved
+
+
+# Run archive_pass() every `interval` seconds in the background
+def start_archive_thread(archive_pass, interval):
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                for name, moved in archive_pass().items():
+                    if moved:
+                        print(f"Archival: moved {moved} documents out of {name}")
+            except Exception as e:
+                print(f"Archival error: {e}")
+
+    thread = threading.Thread(target=loop, name='archival', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,94 @@
+# Regression check for matching loose legacy PDFs to stored reports
+#
+# Stores one report per distinct PDF in uploads/ the way process_pdf did before
+# the upload store existed (no upload-sha256), then dry-runs the reextraction
+# of uploads/ as a legacy directory against them. The stored reports were made
+# from the same files with the same extraction, so a correct match can only add
+# the upload hash and file name; any result field set or removed means a file
+# was applied to another report. Files whose patient name or test date is a
+# placeholder (several tests of one patient share it) must not touch anything.
+#
+#   python benchmarks/legacy_match_check.py
+#   python benchmarks/legacy_match_check.py --no-stub-extraction   # with tabula (needs java)
+#
+# Exits with status 1 when a report would be changed by a file it wasn't made from.
+
+import argparse
+import glob
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, 'benchmarks'))
+
+LINK_FIELDS = {'upload-sha256', 'upload-filename'}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that legacy PDFs only ever update the report they were made from")
+    parser.add_argument('--uploads', default=os.path.join(REPO_DIR, 'uploads'))
+    parser.add_argument('--stub-extraction', action=argparse.BooleanOptionalAction, default=shutil.which('java') is None,
+                        help="read the results table from the pdfplumber text instead of tabula (default without java)")
+    args = parser.parse_args()
+
+    import mongomock
+    import pdfplumber
+    import report_parsing
+    from extraction_workers import run_inline
+    from reextraction import Checkpoint, ReextractionRun, file_sha256
+    from upload_store import UploadStore
+
+    if args.stub_extraction:
+        from loadtest import TextTableReader
+        reader = TextTableReader(pdfplumber)
+        report_parsing.load_extraction_libs = lambda: (pdfplumber, reader)
+
+    collection = mongomock.MongoClient().db.test
+    made_from = {}
+    seen = set()
+    for path in sorted(glob.glob(os.path.join(args.uploads, '*.pdf'))):
+        digest = file_sha256(path)
+        if digest in seen:
+            continue
+        seen.add(digest)
+        try:
+            fields, error = report_parsing.rederive_report(path)
+        except Exception as e:
+            fields, error = None, str(e)
+        if error:
+            continue
+        made_from[collection.insert_one(dict(fields, **{'user-id': 'legacy'})).inserted_id] = os.path.basename(path)
+
+    diff = io.StringIO()
+    with tempfile.TemporaryDirectory() as store_dir:
+        run = ReextractionRun(
+            [collection], UploadStore(store_dir), lambda path: run_inline(report_parsing.rederive_report, path),
+            Checkpoint(None), report_parsing.REPORT_METADATA_FIELDS,
+            workers=1, dry_run=True, diff_file=diff, echo=lambda message: None,
+        )
+        summary = run.run(args.uploads)
+
+    problems = []
+    for line in diff.getvalue().splitlines():
+        entry = json.loads(line)
+        touched = (set(entry['set']) - LINK_FIELDS) | set(entry['unset'])
+        source = os.path.basename(entry['source'])
+        report = next(name for _id, name in made_from.items() if str(_id) == entry['report'])
+        if touched:
+            problems.append(f"{source} would change {', '.join(sorted(touched))} of the report made from {report}")
+
+    print(f"{len(made_from)} stored reports, {summary['stats']}")
+    for problem in problems:
+        print("  " + problem)
+    if problems:
+        sys.exit(1)
+    print("OK: every legacy file matched at most its own report")
+
+
+if __name__ == '__main__':
+    main()
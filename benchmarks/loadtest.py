@@ -0,0 +1,342 @@
+# Load-test harness for the whole API
+#
+# Starts main.app in a child process on a local port, backed by stand-ins so it
+# can run anywhere:
+#   * MongoDB: mongomock in the server process, or --mongo-uri for a real local
+#     mongod (e.g. `docker run -p 27017:27017 mongo`)
+#   * tabula: with --stub-extraction (the default when no `java` is on PATH) the
+#     results table is read from the pdfplumber text instead of the JVM
+# and then drives a weighted mix of traffic at increasing concurrency:
+#   upload   POST /process-pdf with PDFs drawn from uploads/
+#   profile  GET /patient_profiling with minted JWTs
+#   latest   GET one of the /latest-* polling routes
+#   stats    GET /api/dashboard-stats
+#   history  GET /patient-history
+#
+#   python benchmarks/loadtest.py --concurrency 1,2,4,8,16 --duration 10
+#   python benchmarks/loadtest.py --mix upload=1,latest=10 --json results.json
+#
+# For every concurrency level it prints throughput, latency percentiles and
+# error rates per route, then the level at which throughput stops scaling.
+
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+import warnings
+
+# The app's HS256 secret is shorter than PyJWT recommends; that is not what is being measured
+warnings.filterwarnings('ignore', message='The HMAC key')
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+LATEST_ROUTES = ['/latest-patient', '/latest-creatinine', '/latest-bmi', '/latest-age', '/latest-diet-plan']
+DEFAULT_MIX = 'upload=1,profile=4,latest=10,stats=1'
+SATURATION_GAIN = 0.10  # a level adding less than 10% throughput counts as saturated
+
+
+# ---------------------------------------------------------------- server side
+
+# Stand-in for tabula.read_pdf: rebuild the results table from the report text
+class TextTableReader:
+    QUALITATIVE = {'negative', 'nil', 'positive', 'trace', 'clear', 'turbid', 'yellow'}
+
+    def __init__(self, pdfplumber):
+        self.pdfplumber = pdfplumber
+
+    def read_pdf(self, path, pages='all', multiple_tables=True):
+        import pandas as pd
+
+        with self.pdfplumber.open(path) as pdf:
+            text = pdf.pages[0].extract_text() or ''
+        rows = []
+        in_table = False
+        for line in text.splitlines():
+            if line.startswith('Parameter Result'):
+                in_table = True
+                continue
+            if not in_table or line.startswith('Remarks'):
+                continue
+            tokens = line.split()
+            for i, token in enumerate(tokens[1:], start=1):
+                if any(ch.isdigit() for ch in token) or token.lower() in self.QUALITATIVE or set(token) == {'+'}:
+                    rows.append({'Unnamed: 0': ' '.join(tokens[:i]), 'Result': token})
+                    break
+        if not rows:
+            return []
+        return [pd.DataFrame(rows)]
+
+
+def seed_data(main, users, reports_per_user):
+    rng = random.Random(7)
+    reports = [
+        {
+            'patient-name': f'Patient {u}', 'patient-age': str(rng.randint(20, 80)),
+            'test-date-time': f'{rng.randint(10, 28)}-MAY-24 05:22:11 AM', 'user-id': f'loadtest-{u}',
+            'Creatinine': round(rng.uniform(0.5, 9), 2),
+        }
+        for u in range(users) for _ in range(reports_per_user)
+    ]
+    if reports:
+        main.get_collection(main.TEST_COLLECTION).insert_many(reports)
+    main.get_collection(main.BMI_COLLECTION).insert_one({'age': 40, 'weight': 70, 'height': 175, 'bmi': 22.9, 'timestamp': 'seed'})
+    main.get_collection(main.DIET_PLANS_COLLECTION).insert_one({'gfrResult': 60, 'ckdStageMessage': 'Stage 2', 'mealPlan': 'seed'})
+    main.get_collection(main.USERS_COLLECTION).insert_many([{'_id': f'loadtest-{u}'} for u in range(users)])
+
+
+def serve(port, options, ready):
+    os.environ['UPLOAD_STORE_DIR'] = options['upload_dir']
+    if options['stub_extraction']:
+        # The stand-in is patched into this process, so extraction has to run here too
+        os.environ['EXTRACTION_WORKERS'] = '0'
+    if not options['server_log']:
+        # Per-request access log lines and route prints would dominate the output
+        import logging
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        sys.stdout = open(os.devnull, 'w')
+    import main
+
+    if options['mongo_uri']:
+        main.MONGO_URI = options['mongo_uri']
+        main.MONGO_DB_NAME = options['db_name']
+        main.get_db().client.drop_database(options['db_name'])
+    else:
+        import mongomock
+        main._mongo_client = mongomock.MongoClient()
+
+    if options['stub_extraction']:
+        import pdfplumber
+        import report_parsing
+        reader = TextTableReader(pdfplumber)
+        report_parsing.load_extraction_libs = lambda: (pdfplumber, reader)
+
+    seed_data(main, options['users'], options['seed_reports'])
+
+    from werkzeug.serving import make_server
+    server = make_server('127.0.0.1', port, main.app, threaded=True)
+    ready.set()
+    server.serve_forever()
+
+
+# ---------------------------------------------------------------- client side
+
+def mint_tokens(users):
+    import jwt
+    from main import JWT_SECRET_KEY
+    return [jwt.encode({'id': f'loadtest-{u}'}, JWT_SECRET_KEY, algorithm='HS256') for u in range(users)]
+
+
+def multipart_body(filename, data):
+    boundary = uuid.uuid4().hex
+    head = (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        'Content-Type: application/pdf\r\n\r\n'
+    ).encode()
+    return head + data + f'\r\n--{boundary}--\r\n'.encode(), f'multipart/form-data; boundary={boundary}'
+
+
+class TrafficMix:
+    def __init__(self, base_url, mix, tokens, pdfs):
+        self.base_url = base_url
+        self.kinds = [kind for kind, weight in mix.items() for _ in range(weight)]
+        self.tokens = tokens
+        self.pdfs = pdfs
+
+    # (route label, urllib Request) for one randomly chosen request
+    def next_request(self, rng):
+        kind = rng.choice(self.kinds)
+        auth = {'Authorization': f'Bearer {rng.choice(self.tokens)}'}
+        if kind == 'upload':
+            name, data = rng.choice(self.pdfs)
+            body, content_type = multipart_body(name, data)
+            return '/process-pdf', urllib.request.Request(
+                self.base_url + '/process-pdf', data=body, method='POST', headers=dict(auth, **{'Content-Type': content_type}))
+        if kind == 'profile':
+            return '/patient_profiling', urllib.request.Request(self.base_url + '/patient_profiling', headers=auth)
+        if kind == 'latest':
+            route = rng.choice(LATEST_ROUTES)
+            return route, urllib.request.Request(self.base_url + route)
+        if kind == 'stats':
+            return '/api/dashboard-stats', urllib.request.Request(self.base_url + '/api/dashboard-stats')
+        return '/patient-history', urllib.request.Request(self.base_url + '/patient-history')
+
+
+def send(request, timeout):
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        e.read()
+        status = e.code
+    except Exception:
+        status = None  # connection error / timeout
+    return status, time.perf_counter() - started
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(q / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_level(traffic, concurrency, duration, timeout):
+    samples = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(seed):
+        rng = random.Random(seed)
+        local = []
+        while time.perf_counter() < deadline:
+            route, request = traffic.next_request(rng)
+            status, elapsed = send(request, timeout)
+            local.append((route, status, elapsed))
+        with lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(concurrency * 1000 + i,)) for i in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+    return summarize_level(samples, concurrency, wall)
+
+
+def summarize_level(samples, concurrency, wall):
+    def stats(rows):
+        latencies = sorted(elapsed * 1000 for _, _, elapsed in rows)
+        errors = sum(1 for _, status, _ in rows if status is None or status >= 500)
+        rejected = sum(1 for _, status, _ in rows if status is not None and 400 <= status < 500)
+        return {
+            'requests': len(rows),
+            'throughput': round(len(rows) / wall, 1),
+            'p50_ms': round(percentile(latencies, 50), 1) if latencies else None,
+            'p95_ms': round(percentile(latencies, 95), 1) if latencies else None,
+            'p99_ms': round(percentile(latencies, 99), 1) if latencies else None,
+            'error_rate': round(errors / len(rows), 4) if rows else 0,
+            'client_error_rate': round(rejected / len(rows), 4) if rows else 0,
+        }
+
+    routes = sorted({route for route, _, _ in samples})
+    return {
+        'concurrency': concurrency,
+        'total': stats(samples),
+        'routes': {route: stats([s for s in samples if s[0] == route]) for route in routes},
+    }
+
+
+# First level where adding clients no longer adds throughput (or errors appear)
+def find_saturation(levels):
+    for previous, current in zip(levels, levels[1:]):
+        gain = (current['total']['throughput'] - previous['total']['throughput']) / max(previous['total']['throughput'], 1e-9)
+        if gain < SATURATION_GAIN or current['total']['error_rate'] > 0.01:
+            return {
+                'concurrency': current['concurrency'],
+                'peak_throughput': max(level['total']['throughput'] for level in levels),
+                'p95_ms_before': previous['total']['p95_ms'],
+                'p95_ms_at': current['total']['p95_ms'],
+            }
+    return None
+
+
+def print_level(level):
+    print(f"\n== concurrency {level['concurrency']}")
+    print(f"{'route':24} {'req':>6} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'5xx%':>6} {'4xx%':>6}")
+    for route, s in list(level['routes'].items()) + [('TOTAL', level['total'])]:
+        print(f"{route:24} {s['requests']:>6} {s['throughput']:>8} {s['p50_ms']:>8} {s['p95_ms']:>8} {s['p99_ms']:>8} "
+              f"{s['error_rate'] * 100:>6.1f} {s['client_error_rate'] * 100:>6.1f}")
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        kind, _, weight = part.partition('=')
+        if kind not in ('upload', 'profile', 'latest', 'stats', 'history'):
+            raise SystemExit(f"Unknown traffic kind: {kind}")
+        if int(weight or 1) > 0:
+            mix[kind] = int(weight or 1)
+    return mix
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive a traffic mix against the API at increasing concurrency")
+    parser.add_argument('--concurrency', default='1,2,4,8,16', help="comma-separated client counts")
+    parser.add_argument('--duration', type=float, default=10, help="seconds per concurrency level")
+    parser.add_argument('--mix', default=DEFAULT_MIX, help="weights, e.g. upload=1,profile=4,latest=10,stats=1,history=0")
+    parser.add_argument('--users', type=int, default=50, help="distinct JWT users")
+    parser.add_argument('--seed-reports', type=int, default=20, help="reports stored per user before the run")
+    parser.add_argument('--mongo-uri', help="real MongoDB to use instead of mongomock (database is dropped first)")
+    parser.add_argument('--db-name', default='nephro-health-coach-loadtest')
+    parser.add_argument('--stub-extraction', action=argparse.BooleanOptionalAction, default=shutil.which('java') is None,
+                        help="read result tables from the PDF text instead of tabula (default when java is missing)")
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--json', help="write all results to this file")
+    parser.add_argument('--server-log', action='store_true', help="show the server's access log and prints")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    pdfs = [(os.path.basename(path), open(path, 'rb').read()) for path in sorted(glob.glob(os.path.join(REPO_DIR, 'uploads', '*.pdf')))]
+    upload_dir = tempfile.mkdtemp(prefix='loadtest-uploads-')
+    options = {
+        'mongo_uri': args.mongo_uri, 'db_name': args.db_name, 'stub_extraction': args.stub_extraction,
+        'users': args.users, 'seed_reports': args.seed_reports, 'upload_dir': upload_dir,
+        'server_log': args.server_log,
+    }
+
+    port = free_port()
+    ready = multiprocessing.Event()
+    server = multiprocessing.Process(target=serve, args=(port, options, ready), daemon=True)
+    server.start()
+    try:
+        if not ready.wait(120):
+            raise SystemExit("Server did not start")
+        traffic = TrafficMix(f'http://127.0.0.1:{port}', mix, mint_tokens(args.users), pdfs)
+
+        print(f"Mix {mix}, {args.duration:g}s per level, mongo={'mongomock' if not args.mongo_uri else args.mongo_uri}, "
+              f"extraction={'text stand-in' if args.stub_extraction else 'tabula'}")
+        levels = []
+        for concurrency in (int(c) for c in args.concurrency.split(',')):
+            level = run_level(traffic, concurrency, args.duration, args.timeout)
+            levels.append(level)
+            print_level(level)
+
+        saturation = find_saturation(levels)
+        if saturation:
+            print(f"\nThroughput stops scaling at concurrency {saturation['concurrency']} "
+                  f"(peak {saturation['peak_throughput']} req/s, p95 {saturation['p95_ms_before']} -> {saturation['p95_ms_at']} ms)")
+        else:
+            print("\nThroughput still scaling at the highest concurrency tested")
+
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump({'mix': mix, 'levels': levels, 'saturation': saturation}, f, indent=2)
+    finally:
+        server.terminate()
+        shutil.rmtree(upload_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
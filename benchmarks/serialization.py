@@ -0,0 +1,165 @@
+# Serialisation / compression benchmark for large report payloads
+#
+# Builds report histories shaped like the documents /patient_profiling returns
+# (ObjectId, patient details, ~25 analyte results, stored flags) and measures,
+# per history size:
+#   * CPU time to turn the documents into a response body with
+#       baseline  Flask's default provider after the old `_id` -> str pass
+#       json      json_responses.StdlibJSONProvider, documents as read
+#       orjson    json_responses.OrjsonProvider, documents as read
+#   * bytes on the wire uncompressed, gzip'd and brotli'd (when installed),
+#     and the CPU each encoding costs
+#
+#   python benchmarks/serialization.py
+#   python benchmarks/serialization.py --reports 100,1000,10000 --runs 9
+
+import argparse
+import gzip
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from bson import ObjectId  # noqa: E402
+from flask import Flask  # noqa: E402
+from flask.json.provider import DefaultJSONProvider  # noqa: E402
+
+import json_responses  # noqa: E402
+
+ANALYTES = {
+    'Creatinine': (0.4, 9.0), 'Urea': (10, 200), 'Sodium': (125, 150), 'Potassium': (2.8, 6.8),
+    'Chloride': (90, 115), 'Bicarbonate': (15, 32), 'Serum Albumin': (2.0, 5.5), 'HbA1c': (4.5, 11),
+    'pH': (4.5, 8.5), 'Specific Gravity': (1.000, 1.035), 'Urobilinogen': (0.1, 2.0),
+    'Red Blood Cells': (0, 10), 'White Blood Cells': (0, 20), 'Epithelial Cells': (0, 25),
+}
+QUALITATIVE = ['Protein', 'Glucose', 'Ketone Bodies', 'Bilirubin', 'Leucocyte Esterase', 'Nitrilte', 'Blood/Hemoglobin']
+
+
+def make_report(rng, user_id):
+    report = {
+        '_id': ObjectId(),
+        'patient-name': rng.choice(['Mr. ', 'Mrs. ', 'Ms. ']) + ' '.join(rng.choice(['Ali', 'Ahmed', 'Khan', 'Fatima', 'Sadaqat', 'Bibi']) for _ in range(2)),
+        'patient-age': f"{rng.randint(18, 85)} Year(s)",
+        'patient-sex': rng.choice(['Male', 'Female']),
+        'test-date-time': f"{rng.randint(1, 28):02d}-{rng.randint(1, 12):02d}-2024 {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}",
+        'user-id': user_id,
+        'upload-sha256': '%064x' % rng.getrandbits(256),
+        'upload-filename': f"report-{rng.randint(1, 99999)}.pdf",
+        'similarity-flag': 'unique',
+    }
+    flags = {}
+    for name, (low, high) in ANALYTES.items():
+        report[name] = f"{rng.uniform(low, high):.2f}"
+        flags[name.lower().replace(' ', '-')] = rng.choice(['normal', 'normal', 'normal', 'low', 'high'])
+    for name in QUALITATIVE:
+        report[name] = rng.choice(['Negative', 'Negative', 'Trace', '+', '++'])
+        flags[name.lower().replace(' ', '-')] = 'normal' if report[name] == 'Negative' else 'high'
+    report['flags'] = flags
+    report['abnormal-analytes'] = sorted(k for k, v in flags.items() if v != 'normal')
+    report['worst-flag'] = 'abnormal' if report['abnormal-analytes'] else 'normal'
+    return report
+
+
+def make_history(size, seed=0):
+    rng = random.Random(seed)
+    return [make_report(rng, 'u1') for _ in range(size)]
+
+
+def cpu_ms(function, runs, setup=lambda: None):
+    samples = []
+    for _ in range(runs):
+        argument = setup()
+        start = time.process_time()
+        result = function(argument)
+        samples.append((time.process_time() - start) * 1000)
+    return statistics.median(samples), result
+
+
+def serializers():
+    def app_with(provider_class):
+        app = Flask('serialization-benchmark')
+        app.json = provider_class(app)
+        return app
+
+    baseline_app = app_with(DefaultJSONProvider)
+
+    def baseline(documents):
+        results = []
+        for record in documents:
+            record["_id"] = str(record["_id"])
+            results.append(record)
+        with baseline_app.app_context():
+            return baseline_app.json.response(results).get_data()
+
+    def provider(provider_class):
+        app = app_with(provider_class)
+
+        def serialize(documents):
+            with app.app_context():
+                return app.json.response(documents).get_data()
+        return serialize
+
+    candidates = [('baseline', baseline), ('json', provider(json_responses.StdlibJSONProvider))]
+    if json_responses.json_provider_class('orjson') is json_responses.OrjsonProvider:
+        candidates.append(('orjson', provider(json_responses.OrjsonProvider)))
+    return candidates
+
+
+def encodings():
+    candidates = [('gzip', lambda body: gzip.compress(body, compresslevel=json_responses.GZIP_LEVEL, mtime=0))]
+    brotli = json_responses._brotli()
+    if brotli:
+        candidates.append(('br', lambda body: brotli.compress(body, quality=json_responses.BROTLI_QUALITY)))
+    return candidates
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure JSON serialisation CPU and response size for report histories")
+    parser.add_argument('--reports', default='100,1000,5000', help="comma-separated history sizes")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--json', dest='json_path', help="also write the results to this file")
+    args = parser.parse_args()
+
+    report = []
+    for size in [int(n) for n in args.reports.split(',')]:
+        template = make_history(size)
+        row = {"reports": size, "serialize_cpu_ms": {}, "bytes": {}, "encode_cpu_ms": {}}
+        body = None
+        for name, serialize in serializers():
+            # Fresh copies each run: the baseline rewrites `_id` in place like the old route did
+            elapsed, output = cpu_ms(serialize, args.runs, setup=lambda: [dict(d) for d in template])
+            row["serialize_cpu_ms"][name] = round(elapsed, 2)
+            if body is None:
+                body = output
+            elif json.loads(output) != json.loads(body):
+                row.setdefault("mismatch", []).append(name)
+        row["bytes"]["identity"] = len(body)
+        for name, encode in encodings():
+            elapsed, encoded = cpu_ms(lambda b: encode(b), args.runs, setup=lambda: body)
+            row["bytes"][name] = len(encoded)
+            row["encode_cpu_ms"][name] = round(elapsed, 2)
+        report.append(row)
+
+        print(f"{size} reports")
+        for name, elapsed in row["serialize_cpu_ms"].items():
+            speedup = row["serialize_cpu_ms"]["baseline"] / elapsed if elapsed else float('inf')
+            print(f"  serialize {name:<9} {elapsed:9.2f} ms  ({speedup:4.1f}x baseline)")
+        for name, size_bytes in row["bytes"].items():
+            ratio = size_bytes / row["bytes"]["identity"]
+            cost = f"  {row['encode_cpu_ms'][name]:8.2f} ms" if name in row["encode_cpu_ms"] else ''
+            print(f"  {name:<18} {size_bytes:9d} B   ({ratio:5.1%}){cost}")
+        if row.get("mismatch"):
+            print(f"  output differs from baseline: {', '.join(row['mismatch'])}")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
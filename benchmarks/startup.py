@@ -0,0 +1,133 @@
+# Startup-time benchmark for main.py
+#
+# Measures, in fresh interpreters, how long `import main` takes and how long it
+# takes from interpreter start to the first response of a read-only route.
+# Compare the working tree against an older revision to see the effect of lazy
+# imports / lazy DB initialisation:
+#
+#   python benchmarks/startup.py                   # working tree
+#   python benchmarks/startup.py --ref HEAD        # the tree of a git revision
+#   python benchmarks/startup.py --ref HEAD~1 --ref WORKTREE
+#
+# A revision is exported whole (git archive) so main.py finds its sibling
+# modules. Every MongoClient the code creates is pointed at --mongo-uri with
+# connect=False: older revisions hard-code an SRV URI whose DNS lookup would
+# otherwise be timed too (or fail offline), so both sides measure the import
+# and app construction, not the network.
+#
+# The default route (/patient_profiling without a token) answers 401 before any
+# database access, so the numbers are pure process start-up cost. Routes that hit
+# MongoDB can be added with --route, in which case --mongo-uri should point at a
+# reachable server.
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = '''
+import importlib.abc, importlib.util, json, os, sys, time
+
+
+# Patch pymongo.MongoClient as pymongo is imported (importing it here would hide its cost)
+class RedirectMongoClient(importlib.abc.MetaPathFinder):
+    def find_spec(self, name, path, target=None):
+        if name != 'pymongo':
+            return None
+        sys.meta_path.remove(self)
+        spec = importlib.util.find_spec(name)
+        exec_module = spec.loader.exec_module
+
+        def exec_and_patch(module):
+            exec_module(module)
+
+            class MongoClient(module.MongoClient):
+                def __init__(self, host=None, *args, **kwargs):
+                    kwargs['connect'] = False
+                    super().__init__(os.environ['STARTUP_MONGO_URI'], *args, **kwargs)
+            module.MongoClient = MongoClient
+
+        spec.loader.exec_module = exec_and_patch
+        return spec
+
+
+sys.meta_path.insert(0, RedirectMongoClient())
+t0 = time.perf_counter()
+import main
+t1 = time.perf_counter()
+client = main.app.test_client()
+timings = {"import_ms": (t1 - t0) * 1000}
+for route in sys.argv[1:]:
+    r = client.get(route)
+    timings[route] = {"first_response_ms": (time.perf_counter() - t0) * 1000, "status": r.status_code}
+timings["modules"] = sorted(m for m in ("tabula", "pdfplumber", "pandas", "pymongo") if m in sys.modules)
+print(json.dumps(timings))
+'''
+
+
+# Export the tree of the given git revision into a temporary directory
+def checkout_tree(ref, tmp_root):
+    if ref == 'WORKTREE':
+        return REPO_DIR
+    target = os.path.join(tmp_root, ref.replace('/', '_').replace('~', '_'))
+    os.makedirs(target, exist_ok=True)
+    archive = subprocess.Popen(['git', 'archive', ref], cwd=REPO_DIR, stdout=subprocess.PIPE)
+    subprocess.run(['tar', '-x', '-C', target], stdin=archive.stdout, check=True)
+    archive.stdout.close()
+    if archive.wait() != 0:
+        raise SystemExit(f"git archive {ref} failed")
+    return target
+
+
+def run_probe(directory, routes, mongo_uri):
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1', MONGO_URI=mongo_uri, STARTUP_MONGO_URI=mongo_uri)
+    proc = subprocess.run(
+        [sys.executable, '-c', PROBE, *routes],
+        cwd=directory, capture_output=True, text=True, env=env,
+    )
+    if proc.returncode != 0:
+        last_line = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else 'unknown error'
+        return {"error": last_line}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def summarize(samples, routes):
+    ok = [s for s in samples if 'error' not in s]
+    if not ok:
+        return {"error": samples[0]['error']}
+    summary = {"import_ms_median": statistics.median(s['import_ms'] for s in ok)}
+    for route in routes:
+        summary[route] = {
+            "first_response_ms_median": statistics.median(s[route]['first_response_ms'] for s in ok),
+            "status": ok[-1][route]['status'],
+        }
+    summary["heavy_modules_loaded"] = ok[-1]['modules']
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import and first-response time of main.py")
+    parser.add_argument('--ref', action='append', help="git revision to measure (WORKTREE for the checkout)")
+    parser.add_argument('--route', action='append', help="read-only route to request after import")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--mongo-uri', default=os.environ.get('MONGO_URI', 'mongodb://127.0.0.1:27017'),
+                        help="server every MongoClient is pointed at (no connection is made unless a route needs one)")
+    args = parser.parse_args()
+
+    refs = args.ref or ['WORKTREE']
+    routes = args.route or ['/patient_profiling']
+
+    with tempfile.TemporaryDirectory() as tmp_root:
+        for ref in refs:
+            directory = checkout_tree(ref, tmp_root)
+            samples = [run_probe(directory, routes, args.mongo_uri) for _ in range(args.runs)]
+            print(json.dumps({"ref": ref, **summarize(samples, routes)}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
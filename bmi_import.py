@@ -0,0 +1,188 @@
+import csv
+import json
+import re
+
+import numpy as np
+
+# Bulk import of BMI readings exported by smart scales / other apps.
+#
+# The upload is parsed as a stream (CSV with a header row, or NDJSON with one
+# object per line) and handled CHUNK_SIZE rows at a time: rows are validated,
+# BMI is computed for the whole chunk with numpy, duplicate readings (same
+# timestamp, age, weight and height) are dropped and the chunk is written with
+# one insert_many. Only one chunk is held in memory, and duplicates across
+# chunks are caught by looking the chunk's timestamps up in the collection,
+# which already holds earlier chunks.
+#
+# Timestamps keep the type /save-bmi stores: numbers stay numbers (epoch
+# milliseconds from the app, also when they arrive as CSV text), anything else
+# is kept as sent.
+
+CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+REQUIRED_FIELDS = ['age', 'weight', 'height', 'timestamp']
+
+
+# Decoded lines of the upload; the (1-based) numbers of lines that aren't UTF-8 are added to `bad_lines`
+def _decode_lines(stream, bad_lines):
+    for number, line in enumerate(stream, start=1):
+        encoding = 'utf-8-sig' if number == 1 else 'utf-8'
+        try:
+            yield line.decode(encoding)
+        except UnicodeDecodeError:
+            bad_lines.add(number)
+            yield line.decode(encoding, errors='replace')
+
+
+# (row number, row as a dict, error) for the rows of the upload, numbered from 1 (CSV header not counted)
+def iter_rows(stream, file_format):
+    bad_lines = set()
+    lines = _decode_lines(stream, bad_lines)
+    if file_format == 'csv':
+        reader = csv.DictReader(lines)
+        last_line = 1  # the header
+        for number, row in enumerate(reader, start=1):
+            undecodable = any(line in bad_lines for line in range(last_line + 1, reader.line_num + 1))
+            last_line = reader.line_num
+            if undecodable:
+                yield number, None, "Row is not valid UTF-8"
+                continue
+            yield number, {k.strip().lower(): (v.strip() if isinstance(v, str) else v) for k, v in row.items() if k}, None
+        return
+
+    for number, line in enumerate(lines, start=1):
+        if number in bad_lines:
+            yield number, None, "Row is not valid UTF-8"
+            continue
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield number, None, None
+            continue
+        yield number, {str(k).lower(): v for k, v in row.items()} if isinstance(row, dict) else None, None
+
+
+# Guess the format from the file name, falling back to the first byte
+def detect_format(filename, first_bytes):
+    name = (filename or '').lower()
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.ndjson', '.jsonl', '.json')):
+        return 'ndjson'
+    return 'ndjson' if first_bytes.lstrip().startswith(b'{') else 'csv'
+
+
+# Epoch timestamps sent as text ("1718000000000") become numbers; other values are kept as sent
+def normalize_timestamp(value):
+    if isinstance(value, str) and re.fullmatch(r'\s*\d+\s*', value):
+        return int(value)
+    return value
+
+
+def _validate(row, default_age):
+    if row is None:
+        return None, "Row is not a JSON object"
+    if not row.get('age') and default_age:
+        row['age'] = default_age
+    missing = [field for field in REQUIRED_FIELDS if row.get(field) in (None, '')]
+    if missing:
+        return None, f"Missing {', '.join(missing)}"
+    try:
+        age, weight, height = float(row['age']), float(row['weight']), float(row['height'])
+    except (TypeError, ValueError):
+        return None, "age, weight and height must be numbers"
+    if not (0 < age < 130 and 0 < weight < 500 and 0 < height < 300):
+        return None, "age, weight or height out of range"
+    if isinstance(row['timestamp'], (bool, dict, list)):
+        return None, "timestamp must be a number or a string"
+    age = int(age) if age.is_integer() else age
+    return (age, weight, height, normalize_timestamp(row['timestamp'])), None
+
+
+# BMI for arrays of weights (kg) and heights (cm, or m when below 3)
+def compute_bmi(weights, heights):
+    heights_m = np.where(heights < 3, heights, heights / 100)
+    return np.round(weights / heights_m ** 2, 1)
+
+
+class ImportSummary:
+    def __init__(self):
+        self.rows = 0
+        self.inserted = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.errors = []
+
+    def error(self, row_number, message):
+        self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row_number, "error": message})
+
+    def to_dict(self):
+        return {
+            "rows": self.rows,
+            "inserted": self.inserted,
+            "duplicates": self.duplicates,
+            "invalid": self.invalid,
+            "errors": self.errors,
+            "errorsTruncated": self.invalid > len(self.errors),
+        }
+
+
+# What makes two readings the same: (timestamp, age, weight, height), numbers compared as floats
+def _reading_key(timestamp, age, weight, height):
+    try:
+        return timestamp, float(age), float(weight), float(height)
+    except (TypeError, ValueError):
+        return timestamp, str(age), str(weight), str(height)
+
+
+def _write_chunk(collection, chunk, summary, on_insert):
+    # Drop readings repeated inside the chunk or already stored
+    timestamps = list({values[3] for _, values in chunk})
+    stored = collection.find({'timestamp': {'$in': timestamps}}, {'timestamp': 1, 'age': 1, 'weight': 1, 'height': 1})
+    existing = {_reading_key(doc['timestamp'], doc.get('age'), doc.get('weight'), doc.get('height')) for doc in stored}
+    unique = []
+    for row_number, (age, weight, height, timestamp) in chunk:
+        key = _reading_key(timestamp, age, weight, height)
+        if key in existing:
+            summary.duplicates += 1
+            continue
+        existing.add(key)
+        unique.append((age, weight, height, timestamp))
+    if not unique:
+        return
+
+    columns = list(zip(*unique))
+    bmis = compute_bmi(np.array(columns[1], dtype=float), np.array(columns[2], dtype=float))
+    documents = [
+        {"age": age, "weight": weight, "height": height, "bmi": bmi, "timestamp": timestamp}
+        for (age, weight, height, timestamp), bmi in zip(unique, bmis.tolist())
+    ]
+    result = collection.insert_many(documents, ordered=False)
+    summary.inserted += len(result.inserted_ids)
+    if on_insert:
+        on_insert(documents)  # insert_many has set each document's _id
+
+
+# on_insert(documents) is called after each chunk is written
+def import_bmi(stream, file_format, collection, default_age=None, chunk_size=CHUNK_SIZE, on_insert=None):
+    collection.create_index('timestamp')  # duplicate lookups per chunk
+    summary = ImportSummary()
+    chunk = []
+    for row_number, row, error in iter_rows(stream, file_format):
+        summary.rows += 1
+        if not error:
+            values, error = _validate(row, default_age)
+        if error:
+            summary.error(row_number, error)
+            continue
+        chunk.append((row_number, values))
+        if len(chunk) >= chunk_size:
+            _write_chunk(collection, chunk, summary, on_insert)
+            chunk = []
+    if chunk:
+        _write_chunk(collection, chunk, summary, on_insert)
+    return summary.to_dict()
@@ -0,0 +1,277 @@
+import math
+import re
+from datetime import datetime, timezone
+
+from reference_ranges import CRITICAL, HIGH, LOW, analyte_key, parse_sex, parse_value
+
+# Pre-aggregated cohort statistics for the admin dashboard.
+#
+# Every report and BMI record is counted into buckets keyed by
+# (day, test type, age band, CKD stage). A bucket holds the record count and,
+# per analyte, n / sum / sum of squares / min / max plus low, high and critical
+# counts, so means, spreads and abnormal counts for any combination of buckets
+# come from adding a handful of small documents instead of scanning reports.
+#
+# The write routes add each new record with $inc/$min/$max upserts; the
+# rebuild aggregates the stored records in memory and swaps the result in.
+
+UNKNOWN = 'unknown'
+
+# Analyte key (reference_ranges) -> test type. A report counts once per test type it contains.
+TEST_TYPES = {
+    'creatinine': 'renal', 'urea': 'renal', 'albumin': 'renal',
+    'sodium': 'electrolytes', 'potassium': 'electrolytes', 'chloride': 'electrolytes', 'bicarbonate': 'electrolytes',
+    'hba1c': 'hba1c',
+}
+URINE_TEST_TYPE = 'urinalysis'  # every 'urine-*' analyte
+BMI_TEST_TYPE = 'bmi'
+
+AGE_BANDS = [(0, 18, '0-17'), (18, 40, '18-39'), (40, 60, '40-59'), (60, 75, '60-74'), (75, math.inf, '75+')]
+
+# KDIGO GFR categories (mL/min/1.73m²), lowest bound first match
+CKD_STAGES = [(90, 'G1'), (60, 'G2'), (45, 'G3a'), (30, 'G3b'), (15, 'G4'), (0, 'G5')]
+
+BMI_CATEGORIES = [(18.5, 'underweight'), (25, 'normal'), (30, 'overweight'), (math.inf, 'obese')]
+
+DIMENSIONS = ['day', 'month', 'test-type', 'age-band', 'ckd-stage']
+
+REPORT_DATE_FORMATS = ['%d-%b-%y %I:%M:%S %p', '%d-%m-%Y %H:%M', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d']
+
+
+def age_years(value):
+    match = re.search(r'\d+(\.\d+)?', str(value if value is not None else ''))
+    return float(match.group(0)) if match else None
+
+
+def age_band(value):
+    age = age_years(value)
+    if age is None:
+        return UNKNOWN
+    for low, high, label in AGE_BANDS:
+        if low <= age < high:
+            return label
+    return UNKNOWN
+
+
+# CKD-EPI 2021 creatinine equation (no race term); adults with a known sex only
+def egfr(creatinine, age, sex):
+    if creatinine is None or math.isnan(creatinine) or creatinine <= 0 or age is None or age < 18 or sex is None:
+        return None
+    kappa, alpha = (0.7, -0.241) if sex == 'F' else (0.9, -0.302)
+    ratio = creatinine / kappa
+    value = 142 * min(ratio, 1) ** alpha * max(ratio, 1) ** -1.200 * 0.9938 ** age
+    return value * 1.012 if sex == 'F' else value
+
+
+def ckd_stage(egfr_value):
+    if egfr_value is None:
+        return UNKNOWN
+    for lower, stage in CKD_STAGES:
+        if egfr_value >= lower:
+            return stage
+    return UNKNOWN
+
+
+def bmi_category(bmi):
+    for upper, label in BMI_CATEGORIES:
+        if bmi < upper:
+            return label
+    return UNKNOWN
+
+
+# Calendar day (YYYY-MM-DD) of a record: its own date if readable, else when it was inserted
+def record_day(value, inserted_id=None):
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        seconds = value / 1000 if value > 1e11 else value  # epoch milliseconds from the app
+        return datetime.fromtimestamp(seconds, timezone.utc).date().isoformat()
+    text = str(value or '').strip()
+    try:
+        return datetime.fromisoformat(text.replace('Z', '+00:00')).date().isoformat()
+    except ValueError:
+        pass
+    for date_format in REPORT_DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).date().isoformat()
+        except ValueError:
+            continue
+    if inserted_id is not None and hasattr(inserted_id, 'generation_time'):
+        return inserted_id.generation_time.date().isoformat()
+    return UNKNOWN
+
+
+# Test type an analyte key belongs to (None for analytes outside the rollups)
+def analyte_test_type(key):
+    if key.startswith('urine-'):
+        return URINE_TEST_TYPE
+    return TEST_TYPES.get(key)
+
+
+# (bucket key, {analyte: (value, flag)}, extra counters) for each bucket a report falls into
+def report_contributions(record, inserted_id, skip_fields):
+    values = {}
+    for label, value in record.items():
+        key = analyte_key(label) if label not in skip_fields else None
+        if key:
+            values[key] = parse_value(value)
+
+    sex = parse_sex(record.get('patient-sex'))
+    age = age_years(record.get('patient-age'))
+    egfr_value = egfr(values.get('creatinine'), age, sex)
+    day = record_day(record.get('test-date-time'), inserted_id)
+    band = age_band(record.get('patient-age'))
+    stage = ckd_stage(egfr_value)
+    flags = record.get('flags') or {}
+
+    by_type = {}
+    for key, value in values.items():
+        test_type = analyte_test_type(key)
+        if test_type:
+            by_type.setdefault(test_type, {})[key] = (value, flags.get(key))
+    if egfr_value is not None:
+        by_type['renal']['egfr'] = (egfr_value, None)
+
+    contributions = []
+    for test_type, analytes in by_type.items():
+        abnormal = any(flag in (LOW, HIGH, CRITICAL) for _, flag in analytes.values())
+        contributions.append(((day, test_type, band, stage), analytes, {'abnormal-reports': int(abnormal)}))
+    return contributions
+
+
+def bmi_contributions(record, inserted_id):
+    try:
+        bmi = float(record.get('bmi'))
+    except (TypeError, ValueError):
+        return []
+    if math.isnan(bmi):
+        return []
+    day = record_day(record.get('timestamp'), inserted_id)
+    key = (day, BMI_TEST_TYPE, age_band(record.get('age')), UNKNOWN)
+    analytes = {'bmi': (bmi, None)}
+    for name in ('weight', 'height'):
+        try:
+            analytes[name] = (float(record.get(name)), None)
+        except (TypeError, ValueError):
+            pass
+    return [(key, analytes, {'categories.' + bmi_category(bmi): 1})]
+
+
+def bucket_id(key):
+    return '|'.join(key)
+
+
+# Collects contributions into one $inc/$min/$max update per bucket
+class RollupBatch:
+    def __init__(self):
+        self.updates = {}
+
+    def add(self, contributions):
+        for key, analytes, counters in contributions:
+            update = self.updates.get(key)
+            if update is None:
+                update = self.updates[key] = {'$inc': {}, '$min': {}, '$max': {}}
+            inc, low, high = update['$inc'], update['$min'], update['$max']
+            inc['count'] = inc.get('count', 0) + 1
+            for name, amount in counters.items():
+                inc[name] = inc.get(name, 0) + amount
+            for analyte, (value, flag) in analytes.items():
+                prefix = f'analytes.{analyte}.'
+                if flag in (LOW, HIGH, CRITICAL):
+                    inc[prefix + flag] = inc.get(prefix + flag, 0) + 1
+                if value is None or math.isnan(value):
+                    continue
+                inc[prefix + 'n'] = inc.get(prefix + 'n', 0) + 1
+                inc[prefix + 'sum'] = inc.get(prefix + 'sum', 0) + value
+                inc[prefix + 'sumsq'] = inc.get(prefix + 'sumsq', 0) + value * value
+                low[prefix + 'min'] = min(low.get(prefix + 'min', value), value)
+                high[prefix + 'max'] = max(high.get(prefix + 'max', value), value)
+
+    def operations(self):
+        from pymongo import UpdateOne
+
+        operations = []
+        for key, update in self.updates.items():
+            day, test_type, band, stage = key
+            update = {op: fields for op, fields in update.items() if fields}
+            update['$setOnInsert'] = {'day': day, 'test-type': test_type, 'age-band': band, 'ckd-stage': stage}
+            operations.append(UpdateOne({'_id': bucket_id(key)}, update, upsert=True))
+        return operations
+
+    def write(self, collection, chunk_size=1000):
+        operations = self.operations()
+        for start in range(0, len(operations), chunk_size):
+            collection.bulk_write(operations[start:start + chunk_size], ordered=False)
+        return len(operations)
+
+
+def ensure_rollup_indexes(collection):
+    collection.create_index([('day', 1), ('test-type', 1)])
+
+
+# Mongo filter for stored buckets; values that are None are not filtered on
+def bucket_filter(date_from=None, date_to=None, test_type=None, band=None, stage=None):
+    query = {}
+    if date_from or date_to:
+        query['day'] = {}
+        if date_from:
+            query['day']['$gte'] = date_from
+        if date_to:
+            query['day']['$lte'] = date_to
+    for field, value in (('test-type', test_type), ('age-band', band), ('ckd-stage', stage)):
+        if value:
+            query[field] = value
+    return query
+
+
+def _group_key(bucket, group_by):
+    values = []
+    for dimension in group_by:
+        if dimension == 'month':
+            values.append(bucket['day'][:7])
+        else:
+            values.append(bucket[dimension])
+    return tuple(values)
+
+
+# Merge buckets into one summary per group: counts, per-analyte mean/sd/min/max and flag counts
+def summarize_buckets(buckets, group_by):
+    groups = {}
+    for bucket in buckets:
+        group = groups.setdefault(_group_key(bucket, group_by), {'count': 0, 'abnormal-reports': 0, 'analytes': {}, 'categories': {}})
+        group['count'] += bucket.get('count', 0)
+        group['abnormal-reports'] += bucket.get('abnormal-reports', 0)
+        for name, amount in (bucket.get('categories') or {}).items():
+            group['categories'][name] = group['categories'].get(name, 0) + amount
+        for analyte, stats in (bucket.get('analytes') or {}).items():
+            merged = group['analytes'].setdefault(analyte, {'n': 0, 'sum': 0.0, 'sumsq': 0.0, 'min': None, 'max': None, LOW: 0, HIGH: 0, CRITICAL: 0})
+            for field in ('n', 'sum', 'sumsq', LOW, HIGH, CRITICAL):
+                merged[field] += stats.get(field, 0)
+            for field, pick in (('min', min), ('max', max)):
+                if stats.get(field) is not None:
+                    merged[field] = stats[field] if merged[field] is None else pick(merged[field], stats[field])
+
+    summaries = []
+    for key in sorted(groups):
+        group = groups.pop(key)
+        analytes = {}
+        for analyte, stats in sorted(group['analytes'].items()):
+            n = stats['n']
+            mean = stats['sum'] / n if n else None
+            variance = max(stats['sumsq'] / n - mean * mean, 0) if n else None
+            analytes[analyte] = {
+                'n': n,
+                'mean': round(mean, 3) if mean is not None else None,
+                'sd': round(math.sqrt(variance), 3) if variance is not None else None,
+                'min': round(stats['min'], 3) if stats['min'] is not None else None,
+                'max': round(stats['max'], 3) if stats['max'] is not None else None,
+                LOW: stats[LOW],
+                HIGH: stats[HIGH],
+                CRITICAL: stats[CRITICAL],
+            }
+        summary = dict(zip(group_by, key))
+        summary.update({'count': group['count'], 'abnormal-reports': group['abnormal-reports'], 'analytes': analytes})
+        if group['categories']:
+            summary['categories'] = group['categories']
+        summaries.append(summary)
+    return summaries
@@ -0,0 +1,234 @@
+import os
+import queue
+import signal
+import threading
+import time
+from collections import Counter, deque
+
+# Supervised worker processes for the memory-hungry part of extraction
+# (tabula's DataFrames and JVM output, which otherwise pile up in the server).
+#
+# Each job runs in a worker process that is its own process group, so a JVM it
+# starts belongs to the group too. While a job runs the supervisor samples the
+# RSS of the worker's whole process tree; a job that goes over the memory limit
+# or the timeout has its group killed and is reported as a structured failure.
+# Workers are replaced after `max_jobs` jobs or once their RSS stays above
+# `recycle_rss_mb` after a job.
+
+SAMPLE_INTERVAL = 0.05  # seconds between RSS samples
+MB = 1024 * 1024
+
+# Failure reasons
+EXTRACTION_FAILED = 'extraction_failed'
+EXCEPTION = 'exception'
+MEMORY_LIMIT_EXCEEDED = 'memory_limit_exceeded'
+TIMEOUT = 'timeout'
+WORKER_CRASHED = 'worker_crashed'
+
+
+def _read_status_kb(pid, field):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def _children(pid):
+    children = []
+    try:
+        for tid in os.listdir(f'/proc/{pid}/task'):
+            with open(f'/proc/{pid}/task/{tid}/children') as f:
+                children.extend(int(c) for c in f.read().split())
+    except OSError:
+        pass
+    return children
+
+
+# Resident memory of a process and all its descendants, in bytes (None without /proc)
+def process_tree_rss(pid):
+    total = None
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        rss_kb = _read_status_kb(current, 'VmRSS')
+        if rss_kb is not None:
+            total = (total or 0) + rss_kb * 1024
+        pending.extend(_children(current))
+    return total
+
+
+def _worker_main(conn, job_function):
+    os.setpgrp()  # lets the supervisor kill the worker together with any JVM it spawned
+    while True:
+        job = conn.recv()
+        if job is None:
+            return
+        # Reset the peak-RSS counter so VmHWM covers this job only
+        try:
+            with open('/proc/self/clear_refs', 'w') as f:
+                f.write('5')
+        except OSError:
+            pass
+        try:
+            results, error = job_function(job)
+            outcome = ('ok', results) if error is None else ('error', error)
+        except Exception as e:
+            outcome = ('exception', str(e))
+        hwm_kb = _read_status_kb(os.getpid(), 'VmHWM')
+        conn.send(outcome + (hwm_kb * 1024 if hwm_kb is not None else None,))
+
+
+class _Worker:
+    def __init__(self, ctx, job_function):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn, job_function), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.jobs = 0
+
+    def kill(self):
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            self.process.kill()
+        self.process.join(5)
+        self.conn.close()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+            self.process.join(5)
+        except (OSError, EOFError):
+            pass
+        if self.process.is_alive():
+            self.kill()
+        else:
+            self.conn.close()
+
+
+class ExtractionPool:
+    def __init__(self, job_function, size=2, max_jobs=50, memory_limit_mb=1024, recycle_rss_mb=512, timeout=120):
+        import multiprocessing
+        self._ctx = multiprocessing.get_context('spawn')  # never fork the server's threads and sockets
+        self.job_function = job_function
+        self.max_jobs = max_jobs
+        self.memory_limit = memory_limit_mb * MB if memory_limit_mb else None
+        self.recycle_rss = recycle_rss_mb * MB if recycle_rss_mb else None
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = queue.LifoQueue()
+        self._stats_lock = threading.Lock()
+        self._jobs = 0
+        self._failures = Counter()
+        self._recycled = 0
+        self._recent_peaks = deque(maxlen=100)
+        self._max_peak = 0
+
+    # Run one job; always returns a dict, never raises for job failures
+    def run(self, job):
+        with self._slots:
+            try:
+                worker = self._idle.get_nowait()
+                if not worker.process.is_alive():
+                    worker.kill()
+                    worker = _Worker(self._ctx, self.job_function)
+            except queue.Empty:
+                worker = _Worker(self._ctx, self.job_function)
+            outcome, keep = self._supervise(worker, job)
+            if keep:
+                self._idle.put(worker)
+        self._record(outcome)
+        return outcome
+
+    def _supervise(self, worker, job):
+        started = time.perf_counter()
+        pid = worker.process.pid
+        peak = 0
+        worker.jobs += 1
+        worker.conn.send(job)
+
+        def failure(reason, message):
+            return {"ok": False, "reason": reason, "error": message, "results": None,
+                    "peakRssMb": round(peak / MB, 1), "elapsedMs": round((time.perf_counter() - started) * 1000, 1), "worker": pid}
+
+        while True:
+            if worker.conn.poll(SAMPLE_INTERVAL):
+                try:
+                    status, payload, hwm = worker.conn.recv()
+                except (EOFError, OSError):
+                    worker.kill()
+                    return failure(WORKER_CRASHED, "Extraction worker exited unexpectedly"), False
+                break
+
+            rss = process_tree_rss(pid)
+            if rss is not None:
+                peak = max(peak, rss)
+                if self.memory_limit and rss > self.memory_limit:
+                    worker.kill()
+                    return failure(MEMORY_LIMIT_EXCEEDED, f"Extraction used more than {self.memory_limit // MB} MB and was stopped"), False
+            if time.perf_counter() - started > self.timeout:
+                worker.kill()
+                return failure(TIMEOUT, f"Extraction took longer than {self.timeout} s and was stopped"), False
+            if not worker.process.is_alive():
+                worker.kill()
+                return failure(WORKER_CRASHED, f"Extraction worker exited with code {worker.process.exitcode}"), False
+
+        peak = max(peak, hwm or 0)
+        if status == 'ok':
+            outcome = {"ok": True, "reason": None, "error": None, "results": payload}
+        else:
+            outcome = {"ok": False, "reason": EXTRACTION_FAILED if status == 'error' else EXCEPTION, "error": payload, "results": None}
+        outcome.update({"peakRssMb": round(peak / MB, 1), "elapsedMs": round((time.perf_counter() - started) * 1000, 1), "worker": pid})
+
+        # Recycle workers that have done enough jobs or kept too much memory
+        rss_after = process_tree_rss(pid)
+        if worker.jobs >= self.max_jobs or (self.recycle_rss and rss_after and rss_after > self.recycle_rss):
+            worker.stop()
+            with self._stats_lock:
+                self._recycled += 1
+            return outcome, False
+        return outcome, True
+
+    def _record(self, outcome):
+        with self._stats_lock:
+            self._jobs += 1
+            if not outcome['ok']:
+                self._failures[outcome['reason']] += 1
+            self._recent_peaks.append(outcome['peakRssMb'])
+            self._max_peak = max(self._max_peak, outcome['peakRssMb'])
+
+    def stats(self):
+        with self._stats_lock:
+            peaks = sorted(self._recent_peaks)
+            return {
+                "jobs": self._jobs,
+                "failures": dict(self._failures),
+                "recycledWorkers": self._recycled,
+                "idleWorkers": self._idle.qsize(),
+                "maxPeakRssMb": self._max_peak,
+                "medianPeakRssMb": peaks[len(peaks) // 2] if peaks else None,
+                "recentPeakRssMb": list(self._recent_peaks)[-10:],
+            }
+
+    def shutdown(self):
+        while True:
+            try:
+                self._idle.get_nowait().stop()
+            except queue.Empty:
+                return
+
+
+# Same result shape as ExtractionPool.run, for EXTRACTION_WORKERS=0
+def run_inline(job_function, job):
+    started = time.perf_counter()
+    try:
+        results, error = job_function(job)
+        outcome = {"ok": error is None, "reason": None if error is None else EXTRACTION_FAILED, "error": error, "results": results}
+    except Exception as e:
+        outcome = {"ok": False, "reason": EXCEPTION, "error": str(e), "results": None}
+    outcome.update({"peakRssMb": None, "elapsedMs": round((time.perf_counter() - started) * 1000, 1), "worker": os.getpid()})
+    return outcome
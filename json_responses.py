@@ -0,0 +1,114 @@
+import gzip
+
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+
+# JSON serialisation and compression for API responses.
+#
+# Report documents come straight out of MongoDB, so they carry ObjectId and
+# datetime values. The providers below serialise those directly (ObjectId as its
+# hex string, datetimes as ISO 8601), so routes can hand over the documents as
+# read instead of converting each one first. OrjsonProvider is used when orjson
+# is installed, StdlibJSONProvider otherwise or when JSON_SERIALIZER=json.
+#
+# compress_response() is an after_request hook that gzip- or brotli-encodes
+# bodies above a size threshold, using whichever encoding the client prefers
+# (brotli only when the brotli package is installed).
+
+COMPRESSIBLE_MIMETYPES = {'application/json', 'text/plain', 'text/html', 'text/csv'}
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5  # higher levels cost far more CPU for a few percent fewer bytes
+
+
+# Values the json modules don't know: ObjectId (and other bson types) become strings
+def _default(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if type(value).__module__.startswith('bson'):
+        return str(value)
+    if hasattr(value, 'tolist'):  # numpy scalars and arrays
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class StdlibJSONProvider(DefaultJSONProvider):
+    @staticmethod
+    def default(value):
+        try:
+            return _default(value)
+        except TypeError:
+            return DefaultJSONProvider.default(value)
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    def __init__(self, app):
+        super().__init__(app)
+        import orjson
+        self._orjson = orjson
+        # jsonify sorts keys by default; keep the same output
+        self._options = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def _dumps_bytes(self, obj, indent=False):
+        options = self._options | (self._orjson.OPT_INDENT_2 if indent else 0)
+        return self._orjson.dumps(obj, default=_default, option=options)
+
+    def dumps(self, obj, **kwargs):
+        return self._dumps_bytes(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return self._orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = self.compact is False or (self.compact is None and self._app.debug)
+        return self._app.response_class(self._dumps_bytes(obj, indent), mimetype=self.mimetype)
+
+
+# Provider class for `serializer` ('orjson' or 'json'); orjson falls back to json when missing
+def json_provider_class(serializer='orjson'):
+    if serializer == 'orjson':
+        try:
+            import orjson  # noqa: F401
+            return OrjsonProvider
+        except ImportError:
+            print("orjson is not installed, using the standard json module")
+    return StdlibJSONProvider
+
+
+def _brotli():
+    try:
+        import brotli
+        return brotli
+    except ImportError:
+        return None
+
+
+def _encode(body, encoding):
+    if encoding == 'br':
+        return _brotli().compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+# after_request hook factory: compress responses of at least `min_bytes`
+def compressor(min_bytes):
+    encodings = ['br', 'gzip'] if _brotli() else ['gzip']
+
+    def compress_response(response):
+        if (response.direct_passthrough or response.is_streamed
+                or response.status_code < 200 or response.status_code in (204, 304)
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return response
+        body = response.get_data()
+        if len(body) < min_bytes:
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = request.accept_encodings.best_match(encodings)
+        if encoding is None:
+            return response
+        response.set_data(_encode(body, encoding))
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    return compress_response
@@ -0,0 +1,109 @@
+import json
+import queue
+import threading
+import time
+
+# Server-sent events for dashboards and the mobile app.
+#
+# A Broker fans messages out to subscriber queues by channel (one channel per
+# user plus a shared one). Messages are published either directly by the write
+# routes (single process) or from a MongoDB change stream, which every worker
+# process watches so subscribers see writes made by any worker.
+
+HEARTBEAT_SECONDS = 15
+MAX_QUEUED_MESSAGES = 100
+GLOBAL_CHANNEL = 'global'
+
+
+def user_channel(user_id):
+    return f"user:{user_id}"
+
+
+class Subscription:
+    def __init__(self, channels, max_queued):
+        self.channels = set(channels)
+        self.queue = queue.Queue(maxsize=max_queued)
+        self.lock = threading.Lock()  # publishers make room and enqueue as one step
+
+
+class Broker:
+    def __init__(self, max_queued=MAX_QUEUED_MESSAGES):
+        self.max_queued = max_queued
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, channels):
+        subscription = Subscription(channels, self.max_queued)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscriptions)
+
+    def publish(self, channel, event, data):
+        message = format_sse(event, data)
+        with self._lock:
+            targets = [s for s in self._subscriptions if channel in s.channels]
+        for subscription in targets:
+            with subscription.lock:
+                while True:
+                    try:
+                        subscription.queue.put_nowait(message)
+                        break
+                    except queue.Full:
+                        # Slow client: drop its oldest message rather than block the writer
+                        try:
+                            subscription.queue.get_nowait()
+                        except queue.Empty:
+                            pass
+
+
+def format_sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+# Generator for a streaming response; unsubscribes when the client disconnects
+def event_stream(broker, subscription, heartbeat=HEARTBEAT_SECONDS):
+    try:
+        yield "retry: 5000\n\n"
+        while True:
+            try:
+                yield subscription.queue.get(timeout=heartbeat)
+            except queue.Empty:
+                yield ": keep-alive\n\n"
+    finally:
+        broker.unsubscribe(subscription)
+
+
+# Watch inserts into `collections` and call on_insert(collection_name, document).
+# on_unavailable(error) is called if the deployment does not support change
+# streams (standalone mongod); transient errors resume from the last token.
+def start_change_stream_thread(db, collections, on_insert, on_unavailable):
+    from pymongo.errors import OperationFailure, PyMongoError
+
+    pipeline = [{'$match': {'operationType': 'insert', 'ns.coll': {'$in': list(collections)}}}]
+
+    def loop():
+        resume_token = None
+        while True:
+            try:
+                with db.watch(pipeline, resume_after=resume_token) as stream:
+                    for change in stream:
+                        resume_token = stream.resume_token
+                        on_insert(change['ns']['coll'], change['fullDocument'])
+            except OperationFailure as e:
+                on_unavailable(e)
+                return
+            except PyMongoError as e:
+                print(f"Change stream interrupted, resuming: {e}")
+                time.sleep(1)
+
+    thread = threading.Thread(target=loop, name='live-updates-change-stream', daemon=True)
+    thread.start()
+    return thread
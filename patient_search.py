@@ -0,0 +1,108 @@
+import re
+import unicodedata
+from datetime import datetime
+
+from cohort_rollups import TEST_TYPES, UNKNOWN, URINE_TEST_TYPE, age_years, analyte_test_type, record_day
+from reference_ranges import analyte_key
+
+# Patient search over stored reports.
+#
+# Each report carries a few derived fields, written at ingest (and by the
+# backfill for older reports), that the search queries through indexes:
+#   search-tokens  patient name folded to lowercase ASCII words; every word of
+#                  a query must be the prefix of one of them, an index range
+#                  scan per word
+#   search-age     age in years
+#   test-types     test types present in the report (renal, electrolytes, ...)
+#   test-date      YYYY-MM-DD of the test, null when it can't be read (sorts last)
+
+SEARCH_INDEXES = ['search-tokens', 'search-age', 'test-types', [('test-date', -1), ('_id', -1)]]
+SEARCH_TEST_TYPES = sorted(set(TEST_TYPES.values()) | {URINE_TEST_TYPE})
+PLACEHOLDER_NAMES = {'name not found'}
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+
+# Lowercase ASCII words of a name: "  Amna  WALEED w/o ..." -> ['amna', 'waleed', 'w', 'o', ...]
+def name_tokens(name):
+    text = unicodedata.normalize('NFKD', str(name or '')).encode('ascii', 'ignore').decode().casefold()
+    if text.strip() in PLACEHOLDER_NAMES:
+        return []
+    return re.findall(r'[a-z0-9]+', text)
+
+
+def search_fields(record, skip_fields):
+    tokens = name_tokens(record.get('patient-name'))
+    day = record_day(record.get('test-date-time'))
+    analytes = {analyte_key(label) for label in record if label not in skip_fields}
+    test_types = {analyte_test_type(key) for key in analytes if key} - {None}
+    return {
+        'search-tokens': sorted(set(tokens)),
+        'search-age': age_years(record.get('patient-age')),
+        'test-types': sorted(test_types),
+        'test-date': None if day == UNKNOWN else day,
+    }
+
+
+def ensure_search_indexes(collection):
+    for index in SEARCH_INDEXES:
+        collection.create_index(index)
+
+
+# MongoDB filter from the search parameters (q, age-min, age-max, test-type, from, to).
+# `id_range(date_from, date_to)` gives the _id filter used for reports without a readable test date.
+# Returns (query, error message)
+def search_query(args, id_range):
+    conditions = []
+    words = name_tokens(args.get('q'))
+    if args.get('q') and not words:
+        return None, "q must contain letters or digits"
+    for word in words:
+        conditions.append({'search-tokens': {'$regex': '^' + re.escape(word)}})
+
+    ages = {}
+    for name, operator in (('age-min', '$gte'), ('age-max', '$lte')):
+        value = args.get(name)
+        if value:
+            try:
+                ages[operator] = float(value)
+            except ValueError:
+                return None, f"{name} must be a number"
+    if ages:
+        conditions.append({'search-age': ages})
+
+    test_type = args.get('test-type')
+    if test_type:
+        if test_type not in SEARCH_TEST_TYPES:
+            return None, f"test-type must be one of {', '.join(SEARCH_TEST_TYPES)}"
+        conditions.append({'test-types': test_type})
+
+    dates = {}
+    for name, operator in (('from', '$gte'), ('to', '$lte')):
+        value = args.get(name)
+        if value:
+            try:
+                dates[operator] = datetime.strptime(value, '%Y-%m-%d')
+            except ValueError:
+                return None, f"{name} must be a date like 2024-06-01"
+    if dates:
+        conditions.append({'$or': [
+            {'test-date': {operator: value.strftime('%Y-%m-%d') for operator, value in dates.items()}},
+            {'test-date': None, '_id': id_range(dates.get('$gte'), dates.get('$lte'))},
+        ]})
+
+    if not conditions:
+        return {}, None
+    return conditions[0] if len(conditions) == 1 else {'$and': conditions}, None
+
+
+# Number of results requested with ?limit=, or an error message
+def search_limit(args):
+    try:
+        limit = int(args.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        return None, "limit must be a whole number"
+    if not 1 <= limit <= MAX_LIMIT:
+        return None, f"limit must be between 1 and {MAX_LIMIT}"
+    return limit, None
@@ -0,0 +1,146 @@
+import re
+import threading
+import time
+from collections import Counter
+
+# Cheap checks run on every upload before the expensive extraction (pdfplumber
+# tables + tabula/JVM). The byte-level checks take microseconds; the text check
+# parses only the first page, and that page's text and word positions are handed
+# back so extraction does not have to parse it again.
+
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+MAX_PAGES = 10
+PDF_MAGIC = b'%PDF-'
+
+# Phrases printed in the header of the lab reports we accept
+LAB_HEADER_KEYWORDS = [
+    'investigation result',
+    'pathology',
+    'patient name',
+    'specimen type',
+    'reference ranges',
+    'collection date/time',
+    'preliminary date/time',
+]
+MIN_KEYWORD_HITS = 2
+
+# Reason codes
+ACCEPTED = 'accepted'
+EMPTY_FILE = 'empty_file'
+NOT_PDF = 'not_pdf'
+TOO_LARGE = 'too_large'
+TOO_MANY_PAGES = 'too_many_pages'
+ENCRYPTED = 'encrypted'
+UNREADABLE_PDF = 'unreadable_pdf'
+NO_TEXT_LAYER = 'no_text_layer'
+NOT_LAB_REPORT = 'not_lab_report'
+
+REASON_MESSAGES = {
+    EMPTY_FILE: "The uploaded file is empty",
+    NOT_PDF: "The uploaded file is not a PDF",
+    TOO_LARGE: f"The uploaded file is larger than {MAX_UPLOAD_BYTES // (1024 * 1024)} MB",
+    TOO_MANY_PAGES: f"Lab reports have at most {MAX_PAGES} pages",
+    ENCRYPTED: "Encrypted PDFs are not supported",
+    UNREADABLE_PDF: "The PDF could not be parsed",
+    NO_TEXT_LAYER: "The PDF has no text layer (scanned image?)",
+    NOT_LAB_REPORT: "The PDF does not look like a lab report",
+}
+
+_PAGE_OBJECT = re.compile(rb'/Type\s*/Page(?![s\w])')
+
+_counts = Counter()
+_counts_lock = threading.Lock()
+
+
+def _record(reason):
+    with _counts_lock:
+        _counts[reason] += 1
+
+
+# Totals per reason code since the process started
+def get_preflight_stats():
+    with _counts_lock:
+        counts = dict(_counts)
+    rejected = sum(v for k, v in counts.items() if k != ACCEPTED)
+    return {"accepted": counts.get(ACCEPTED, 0), "rejected": rejected, "byReason": counts}
+
+
+def _result(reason, started, page_count=None, keyword_hits=None):
+    _record(reason)
+    return {
+        "accepted": reason == ACCEPTED,
+        "reason": reason,
+        "detail": REASON_MESSAGES.get(reason, "OK"),
+        "pageCount": page_count,
+        "keywordHits": keyword_hits,
+        "elapsedMs": round((time.perf_counter() - started) * 1000, 2),
+    }
+
+
+# Byte-level checks: magic number, size, page count, encryption
+def inspect_bytes(data):
+    if not data:
+        return EMPTY_FILE, None
+    if not data[:1024].lstrip().startswith(PDF_MAGIC):
+        return NOT_PDF, None
+    if len(data) > MAX_UPLOAD_BYTES:
+        return TOO_LARGE, None
+    page_count = len(_PAGE_OBJECT.findall(data))
+    if page_count > MAX_PAGES:
+        return TOO_MANY_PAGES, page_count
+    if b'/Encrypt' in data:
+        return ENCRYPTED, page_count
+    return None, page_count
+
+
+def count_keyword_hits(text):
+    lowered = text.lower()
+    return sum(1 for keyword in LAB_HEADER_KEYWORDS if keyword in lowered)
+
+
+# Classify an uploaded file object.
+# Returns (result dict, first page or None) where the first page is
+# {"text": ..., "words": [(word, x0, top), ...]}; the stream is rewound afterwards.
+def run_preflight(stream):
+    started = time.perf_counter()
+    stream.seek(0, 2)
+    size = stream.tell()
+    stream.seek(0)
+    if size > MAX_UPLOAD_BYTES:
+        # Only look at the header so oversized uploads are never read into memory
+        head = stream.read(1024)
+        stream.seek(0)
+        reason = NOT_PDF if not head.lstrip().startswith(PDF_MAGIC) else TOO_LARGE
+        return _result(reason, started), None
+
+    data = stream.read()
+    stream.seek(0)
+    reason, page_count = inspect_bytes(data)
+    if reason:
+        return _result(reason, started, page_count), None
+
+    import pdfplumber
+    try:
+        with pdfplumber.open(stream) as pdf:
+            page_count = len(pdf.pages)
+            if page_count == 0:
+                return _result(UNREADABLE_PDF, started, page_count), None
+            # inspect_bytes can't see page objects packed into compressed object streams
+            if page_count > MAX_PAGES:
+                return _result(TOO_MANY_PAGES, started, page_count), None
+            first_page = pdf.pages[0]
+            text = first_page.extract_text() or ''
+            words = [(w['text'], w['x0'], w['top']) for w in first_page.extract_words()]
+    except Exception:
+        return _result(UNREADABLE_PDF, started, page_count), None
+    finally:
+        stream.seek(0)
+
+    if not text.strip():
+        return _result(NO_TEXT_LAYER, started, page_count), None
+
+    hits = count_keyword_hits(text)
+    if hits < MIN_KEYWORD_HITS:
+        return _result(NOT_LAB_REPORT, started, page_count, hits), None
+
+    return _result(ACCEPTED, started, page_count, hits), {"text": text, "words": words}
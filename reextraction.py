@@ -0,0 +1,265 @@
+import hashlib
+import json
+import os
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from report_parsing import DATE_NOT_FOUND, NAME_NOT_FOUND
+
+# Re-derive stored reports from their uploads after the parsing changes.
+#
+# Sources are the blobs of the upload store (linked to reports through
+# 'upload-sha256') and, optionally, a directory of loose PDFs from before the
+# store existed; those are matched to reports without an upload hash by the
+# re-extracted patient name and test date, and adopted into the store.
+# A loose file is only applied to a report when that match is certain: its name
+# and date were both read (not placeholders), and exactly one report of that
+# patient and date holds the same results. Anything else is counted and left
+# alone, since the same patient often has several tests on one day.
+#
+# Extraction runs through the supervised worker pool, several jobs at a time.
+# Changed fields are written back with bulk updates, and after every bulk write
+# the checkpoint file records which sources are finished, so a crashed or
+# interrupted run picks up where it stopped. A dry run writes nothing and
+# reports which fields would change instead.
+
+CHUNK_SIZE = 1024 * 1024
+PLACEHOLDER_VALUES = {NAME_NOT_FOUND, DATE_NOT_FOUND, '', None}
+
+
+def file_sha256(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def iter_legacy_files(directory):
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if os.path.isfile(path) and name.lower().endswith('.pdf'):
+            yield path
+
+
+class Checkpoint:
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        self.failed = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            self.done = set(state.get('done', []))
+            self.failed = state.get('failed', {})
+
+    def skip(self, key, retry_failed):
+        return key in self.done or (key in self.failed and not retry_failed)
+
+    def save(self):
+        if not self.path:
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'done': sorted(self.done), 'failed': self.failed}, f)
+        os.replace(tmp_path, self.path)  # never leave a half-written checkpoint behind
+
+
+# ($set, $unset) that turn a stored report into the re-derived one.
+# Results the new extraction no longer produces are removed.
+def report_changes(report, fields, metadata_fields):
+    changed = {key: value for key, value in fields.items() if report.get(key) != value}
+    removed = [key for key in report if key not in metadata_fields and key not in fields]
+    return changed, removed
+
+
+class ReextractionRun:
+    # collections: report collections to update (live and archive)
+    # run_job(path) -> outcome dict of extraction_workers (results = re-derived fields)
+    def __init__(self, collections, store, run_job, checkpoint, metadata_fields,
+                 workers=2, batch_size=200, dry_run=False, retry_failed=False, diff_file=None, echo=print):
+        self.collections = collections
+        self.store = store
+        self.run_job = run_job
+        self.checkpoint = checkpoint
+        self.metadata_fields = set(metadata_fields) | {'_id'}
+        self.workers = max(workers, 1)
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.retry_failed = retry_failed
+        self.diff_file = diff_file
+        self.echo = echo
+        self.stats = Counter()
+        self.changed_fields = Counter()
+        self._operations = {collection.name: [] for collection in collections}
+        self._finished_keys = []
+
+    # (checkpoint key, kind, payload): ('blob', digest) for the store, ('legacy', path) for loose files.
+    # Loose files already linked to a report through the store are covered by the blob pass.
+    def sources(self, legacy_dir=None):
+        for digest in sorted(digest for digest, _ in self.store.iter_blobs()):
+            yield digest, 'blob', digest
+        if legacy_dir:
+            for path in iter_legacy_files(legacy_dir):
+                digest = file_sha256(path)
+                if not self._reports_for_upload(digest):
+                    yield 'legacy:' + digest, 'legacy', path
+
+    def _reports_for_upload(self, digest):
+        return [(collection, report) for collection in self.collections for report in collection.find({'upload-sha256': digest})]
+
+    def _legacy_reports(self, fields):
+        query = {'upload-sha256': {'$exists': False}, 'patient-name': fields.get('patient-name'), 'test-date-time': fields.get('test-date-time')}
+        return [(collection, report) for collection in self.collections for report in collection.find(query)]
+
+    def _result_keys(self, document):
+        return {key for key in document if key not in self.metadata_fields}
+
+    # The one report a loose file belongs to: ([(collection, report)], None) or (None, (stat, reason))
+    def _legacy_match(self, fields):
+        if fields.get('patient-name') in PLACEHOLDER_VALUES or fields.get('test-date-time') in PLACEHOLDER_VALUES:
+            return None, ('placeholder', "patient name or test date not readable")
+        candidates = self._legacy_reports(fields)
+        if not candidates:
+            return None, ('unmatched', None)
+        results = self._result_keys(fields)
+        matching = [(collection, report) for collection, report in candidates if self._result_keys(report) == results]
+        if not matching:
+            return None, ('conflicts', f"{len(candidates)} reports of this patient and date hold other results")
+        if len(matching) > 1:
+            return None, ('conflicts', f"{len(matching)} reports of this patient and date hold the same results")
+        return matching, None
+
+    def _extract(self, kind, payload):
+        if kind == 'blob':
+            with self.store.local_path(payload) as path:
+                return self.run_job(path)
+        return self.run_job(payload)
+
+    def run(self, legacy_dir=None, limit=None):
+        in_flight = {}
+        submitted = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for key, kind, payload in self.sources(legacy_dir):
+                if limit is not None and submitted >= limit:
+                    break
+                if self.checkpoint.skip(key, self.retry_failed):
+                    self.stats['skipped'] += 1
+                    continue
+                reports = None
+                if kind == 'blob':
+                    reports = self._reports_for_upload(key)
+                    if not reports:
+                        self.stats['unreferenced'] += 1
+                        self._finish(key)
+                        continue
+                submitted += 1
+                in_flight[executor.submit(self._extract, kind, payload)] = (key, kind, payload, reports)
+
+                # Keep a bounded number of jobs queued so memory stays flat on big stores
+                if len(in_flight) >= self.workers * 2:
+                    in_flight = self._collect(in_flight, FIRST_COMPLETED)
+            self._collect(in_flight, None)
+        self._flush()
+        return self.summary()
+
+    def _collect(self, in_flight, return_when):
+        if not in_flight:
+            return in_flight
+        done, _ = wait(in_flight, return_when=return_when) if return_when else (set(in_flight), None)
+        for future in done:
+            key, kind, payload, reports = in_flight.pop(future)
+            try:
+                outcome = future.result()
+            except Exception as e:
+                outcome = {'ok': False, 'reason': 'exception', 'error': str(e)}
+            self._apply(key, kind, payload, reports, outcome)
+        return in_flight
+
+    def _apply(self, key, kind, payload, reports, outcome):
+        self.stats['extracted'] += 1
+        if not outcome['ok']:
+            self.stats['failed'] += 1
+            self.checkpoint.failed[key] = f"{outcome['reason']}: {outcome['error']}"
+            self.echo(f"Failed {payload}: {outcome['error']}")
+            return
+        self.checkpoint.failed.pop(key, None)
+        fields = outcome['results']
+
+        extra = {}
+        if kind == 'legacy':
+            reports, skipped = self._legacy_match(fields)
+            if skipped:
+                stat, reason = skipped
+                self.stats[stat] += 1
+                if reason:
+                    self.echo(f"Skipped {payload}: {reason}")
+                self._finish(key)
+                return
+            # Adopt the file into the upload store so later runs find it by hash
+            if not self.dry_run:
+                with open(payload, 'rb') as f:
+                    self.store.put(f)
+            extra = {'upload-sha256': key.split(':', 1)[1], 'upload-filename': os.path.basename(payload)}
+
+        for collection, report in reports:
+            changed, removed = report_changes(report, dict(fields, **extra), self.metadata_fields)
+            if not changed and not removed:
+                self.stats['unchanged'] += 1
+                continue
+            self.stats['changed'] += 1
+            self.changed_fields.update(list(changed) + removed)
+            self._record_diff(collection.name, report, changed, removed, payload)
+            update = {}
+            if changed:
+                update['$set'] = changed
+            if removed:
+                update['$unset'] = {field: '' for field in removed}
+            self._operations[collection.name].append((report['_id'], update))
+        if kind == 'legacy':
+            self._finished_keys.append(extra['upload-sha256'])  # now a stored blob, already up to date
+        self._finish(key)
+
+    def _record_diff(self, collection_name, report, changed, removed, source):
+        if self.diff_file is None and not self.dry_run:
+            return
+        entry = {
+            'report': str(report['_id']),
+            'collection': collection_name,
+            'source': source,
+            'set': {field: [report.get(field), value] for field, value in changed.items()},
+            'unset': {field: report[field] for field in removed},
+        }
+        if self.diff_file is not None:
+            self.diff_file.write(json.dumps(entry, default=str) + '\n')
+        if self.dry_run and self.stats['changed'] <= 20:
+            details = ', '.join(f"{field}: {old!r} -> {new!r}" for field, (old, new) in entry['set'].items())
+            if removed:
+                details += (', ' if details else '') + 'removed ' + ', '.join(removed)
+            self.echo(f"{collection_name} {entry['report']}: {details}")
+
+    def _finish(self, key):
+        self._finished_keys.append(key)
+        if sum(len(ops) for ops in self._operations.values()) >= self.batch_size or len(self._finished_keys) >= self.batch_size:
+            self._flush()
+
+    # Write pending updates, then record their sources as done
+    def _flush(self):
+        from pymongo import UpdateOne
+
+        if not self.dry_run:
+            for collection in self.collections:
+                operations = self._operations[collection.name]
+                if operations:
+                    collection.bulk_write([UpdateOne({'_id': _id}, update) for _id, update in operations], ordered=False)
+                    self.stats['updated'] += len(operations)
+            self.checkpoint.done.update(self._finished_keys)
+            self.checkpoint.save()
+        for operations in self._operations.values():
+            operations.clear()
+        if self._finished_keys:
+            self.echo(f"Processed {self.stats['extracted']} uploads, {self.stats['changed']} reports changed, {self.stats['failed']} failed")
+        self._finished_keys = []
+
+    def summary(self):
+        return {'stats': dict(self.stats), 'changedFields': dict(self.changed_fields.most_common())}
@@ -0,0 +1,228 @@
+import re
+
+import numpy as np
+
+# Reference-range flagging for lab results.
+#
+# Each rule covers one analyte for a sex ('M', 'F' or None for both) and an age
+# band in years, with normal limits and optional critical limits. Ranges follow
+# the intervals printed on the Indus Hospital reports in uploads/; critical
+# limits are common laboratory panic values. Rules are listed most specific
+# first and the first matching rule wins.
+#
+# Results are flagged with numpy over whole arrays of (analyte, value, sex, age)
+# rows, so one code path serves a single upload and a backfill of the history.
+
+NORMAL = 'normal'
+LOW = 'low'
+HIGH = 'high'
+CRITICAL = 'critical'
+UNKNOWN = 'unknown'
+
+DEFAULT_AGE = 30  # reports without a readable age are flagged against adult ranges
+AGE_UNITS = {'y': 1, 'm': 1 / 12, 'w': 7 / 365.25, 'd': 1 / 365.25}  # first letter of Yrs, Mon, Weeks, Days
+
+INF = float('inf')
+
+# (analyte, sex, age_from, age_to, low, high, critical_low, critical_high)
+REFERENCE_RANGES = [
+    ('creatinine', None, 0, 1 / 12, 0.3, 1.0, None, 4.0),
+    ('creatinine', None, 1 / 12, 2, 0.2, 0.4, None, 4.0),
+    ('creatinine', None, 2, 12, 0.3, 0.7, None, 4.0),
+    ('creatinine', None, 12, 18, 0.5, 1.0, None, 4.0),
+    ('creatinine', 'M', 18, INF, 0.72, 1.25, None, 4.0),
+    ('creatinine', 'F', 18, INF, 0.57, 1.11, None, 4.0),
+    ('creatinine', None, 18, INF, 0.57, 1.25, None, 4.0),
+    ('urea', None, 0, 1 / 12, 9, 26, None, 214),
+    ('urea', None, 1 / 12, 18, 11, 39, None, 214),
+    ('urea', None, 18, 60, 13, 43, None, 214),
+    ('urea', None, 60, INF, 17, 49, None, 214),
+    ('albumin', None, 0, INF, 3.5, 5.2, 1.5, None),
+    ('sodium', None, 0, INF, 136, 145, 120, 160),
+    ('potassium', None, 0, INF, 3.5, 5.1, 2.5, 6.5),
+    ('chloride', None, 0, INF, 98, 107, 80, 120),
+    ('bicarbonate', None, 0, INF, 22, 29, 10, 40),
+    ('hba1c', None, 0, INF, None, 5.6, None, None),
+    ('urine-ph', None, 0, INF, 4.5, 8.0, None, None),
+    ('urine-specific-gravity', None, 0, INF, 1.005, 1.025, None, None),
+    ('urine-urobilinogen', None, 0, INF, 0.5, 1.0, None, None),
+    ('urine-rbc', None, 0, INF, None, 2, None, None),
+    ('urine-wbc', None, 0, INF, None, 5, None, None),
+    ('urine-epithelial-cells', None, 0, INF, None, 20, None, None),
+    # Qualitative urine findings: negative/nil reads as 0, anything present is high
+    ('urine-protein', None, 0, INF, None, 0, None, None),
+    ('urine-glucose', None, 0, INF, None, 0, None, None),
+    ('urine-ketones', None, 0, INF, None, 0, None, None),
+    ('urine-bilirubin', None, 0, INF, None, 0, None, None),
+    ('urine-leucocyte-esterase', None, 0, INF, None, 0, None, None),
+    ('urine-blood', None, 0, INF, None, 0, None, None),
+    ('urine-nitrite', None, 0, INF, None, 0, None, None),
+    ('urine-appearance', None, 0, INF, None, 0, None, None),
+]
+
+# Result labels as printed on reports -> analyte keys used above
+ANALYTE_ALIASES = {
+    'creatinine': 'creatinine',
+    'urea': 'urea',
+    'serumalbumin': 'albumin',
+    'albumin': 'albumin',
+    'sodium': 'sodium',
+    'potassium': 'potassium',
+    'chloride': 'chloride',
+    'bicarbonate': 'bicarbonate',
+    'glycatedhemoglobinhba1c': 'hba1c',
+    'hba1c': 'hba1c',
+    'ph': 'urine-ph',
+    'specificgravity': 'urine-specific-gravity',
+    'urobilinogen': 'urine-urobilinogen',
+    'redbloodcells': 'urine-rbc',
+    'whitebloodcells': 'urine-wbc',
+    'epithelialcells': 'urine-epithelial-cells',
+    'protein': 'urine-protein',
+    'glucose': 'urine-glucose',
+    'ketonebodies': 'urine-ketones',
+    'bilirubin': 'urine-bilirubin',
+    'leucocyteesterase': 'urine-leucocyte-esterase',
+    'bloodhemoglobin': 'urine-blood',
+    'nitrite': 'urine-nitrite',
+    'nitrilte': 'urine-nitrite',  # spelled this way on the reports
+    'appearance': 'urine-appearance',
+}
+
+QUALITATIVE_VALUES = {
+    'negative': 0, 'nil': 0, 'absent': 0, 'clear': 0, 'normal': 0,
+    'trace': 0.5, 'positive': 1, 'present': 1, 'turbid': 1, 'hazy': 1, 'cloudy': 1,
+}
+
+_ANALYTES = sorted({rule[0] for rule in REFERENCE_RANGES})
+_ANALYTE_INDEX = {name: i for i, name in enumerate(_ANALYTES)}
+_SEX_CODES = {None: 0, 'M': 1, 'F': 2}
+
+_rules = np.array([
+    (_ANALYTE_INDEX[a], _SEX_CODES[sex], lo_age, hi_age,
+     np.nan if low is None else low, np.nan if high is None else high,
+     np.nan if crit_low is None else crit_low, np.nan if crit_high is None else crit_high)
+    for a, sex, lo_age, hi_age, low, high, crit_low, crit_high in REFERENCE_RANGES
+], dtype=float)
+
+
+def analyte_key(label):
+    return ANALYTE_ALIASES.get(re.sub(r'[^a-z0-9]', '', str(label).lower()))
+
+
+def parse_sex(value):
+    value = str(value or '').strip().lower()
+    if value.startswith('m'):
+        return 'M'
+    if value.startswith('f'):
+        return 'F'
+    return None
+
+
+# Age in (fractional) years: "53 Yrs 11 Mon 1 Days" -> 53.92, "0 Yrs 6 Mon" -> 0.5; a bare number is years
+def parse_age(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    parts = re.findall(r'(\d+(?:\.\d+)?)\s*([a-z]*)', str(value or ''), re.IGNORECASE)
+    if not parts:
+        return DEFAULT_AGE
+    years = None
+    for number, unit in parts:
+        factor = AGE_UNITS.get(unit[:1].lower())
+        if factor:
+            years = (years or 0) + float(number) * factor
+    return years if years is not None else float(parts[0][0])
+
+
+# Numeric value of a printed result: "10.55", ">=1.030", "2-4" (upper end), "+++" (3), "Negative" (0)
+def parse_value(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    text = str(value).strip().lower()
+    if not text:
+        return np.nan
+    if set(text) == {'+'}:
+        return float(len(text))
+    if text in QUALITATIVE_VALUES:
+        return float(QUALITATIVE_VALUES[text])
+    numbers = re.findall(r'\d+(?:\.\d+)?', text)
+    if not numbers:
+        return np.nan
+    return max(float(n) for n in numbers)
+
+
+# Vectorised flagging. All arguments are equal-length arrays:
+# analyte index (-1 for unknown analytes), numeric value, sex code, age in years.
+def flag_arrays(analytes, values, sexes, ages):
+    analytes = np.asarray(analytes, dtype=float)[:, None]
+    values = np.asarray(values, dtype=float)
+    sexes = np.asarray(sexes, dtype=float)[:, None]
+    ages = np.asarray(ages, dtype=float)[:, None]
+
+    matches = (
+        (analytes == _rules[:, 0])
+        & ((_rules[:, 1] == 0) | (sexes == _rules[:, 1]))
+        & (ages >= _rules[:, 2]) & (ages < _rules[:, 3])
+    )
+    has_rule = matches.any(axis=1)
+    rule = _rules[matches.argmax(axis=1)]
+    low, high, crit_low, crit_high = rule[:, 4], rule[:, 5], rule[:, 6], rule[:, 7]
+
+    with np.errstate(invalid='ignore'):
+        flags = np.full(values.shape, NORMAL, dtype=object)
+        flags[values < low] = LOW
+        flags[values > high] = HIGH
+        flags[(values <= crit_low) | (values >= crit_high)] = CRITICAL
+    flags[~has_rule | np.isnan(values)] = UNKNOWN
+    return flags
+
+
+def encode_rows(rows):
+    analytes, values, sexes, ages = [], [], [], []
+    for label, value, sex, age in rows:
+        key = analyte_key(label)
+        analytes.append(_ANALYTE_INDEX[key] if key else -1)
+        values.append(parse_value(value))
+        sexes.append(_SEX_CODES[parse_sex(sex)])
+        ages.append(parse_age(age))
+    return analytes, values, sexes, ages
+
+
+# Flags for one report: {analyte key: flag}, for the results that have a reference range
+def flag_results(results, sex, age):
+    rows = [(label, value, sex, age) for label, value in results.items() if analyte_key(label)]
+    if not rows:
+        return {}
+    flags = flag_arrays(*encode_rows(rows))
+    return {analyte_key(label): flag for (label, _, _, _), flag in zip(rows, flags)}
+
+
+# Fields stored on a report alongside its flags; 'unknown' when no analyte could be flagged
+def flag_summary(flags):
+    abnormal = sorted(key for key, flag in flags.items() if flag in (LOW, HIGH, CRITICAL))
+    if any(flag == CRITICAL for flag in flags.values()):
+        worst = CRITICAL
+    elif abnormal:
+        worst = 'abnormal'
+    elif NORMAL in flags.values():
+        worst = NORMAL
+    else:
+        worst = UNKNOWN
+    return {'flags': flags, 'abnormal-analytes': abnormal, 'worst-flag': worst}
+
+
+# Flag many stored reports in one vectorised pass: {report _id: {analyte key: flag}}
+def flag_documents(documents, skip_fields):
+    rows, owners = [], []
+    flags_by_report = {}
+    for document in documents:
+        flags_by_report[document['_id']] = {}
+        for label, value in document.items():
+            key = analyte_key(label) if label not in skip_fields else None
+            if key:
+                rows.append((label, value, document.get('patient-sex'), document.get('patient-age')))
+                owners.append((document['_id'], key))
+    if rows:
+        for (report_id, key), flag in zip(owners, flag_arrays(*encode_rows(rows))):
+            flags_by_report[report_id][key] = flag
+    return flags_by_report
@@ -0,0 +1,107 @@
+import re
+
+# Reading a lab report: patient details from the first-page text, the results
+# table via tabula, and the fields stored with a report.
+#
+# The extraction jobs (extract_results, rederive_report) run in spawned worker
+# processes (see extraction_workers.py), which import this module to unpickle
+# them. It must not import main: that would build the app and start its
+# background threads in every worker.
+
+# Stored when a detail can't be read from the report
+NAME_NOT_FOUND = "Name not found"
+AGE_NOT_FOUND = "Age not found"
+DATE_NOT_FOUND = "Date/Time not found"
+SEX_NOT_FOUND = "Gender not found"
+
+# Fields stored with a report that are not test results
+REPORT_METADATA_FIELDS = ['_id', 'patient-name', 'patient-age', 'test-date-time', 'user-id', 'upload-sha256', 'upload-filename', 'similarity-flag',
+                          'patient-sex', 'flags', 'abnormal-analytes', 'worst-flag',
+                          'search-tokens', 'search-age', 'test-types', 'test-date',
+                          'search-name']  # no longer written; removed from older reports by backfill-search
+
+
+# Import the PDF extraction libraries (only called from the extraction path)
+def load_extraction_libs():
+    import pdfplumber
+    import tabula
+    return pdfplumber, tabula
+
+
+# Extract patient details from the text of a report's first page
+def parse_patient_details(text):
+    # Extract patient name using regular expression
+    name_match = re.search(r'(Patient Name|Name|Patient)\s*:\s*(.*)', text, re.IGNORECASE)
+    patient_name = name_match.group(2).strip() if name_match else NAME_NOT_FOUND
+
+    # Extract patient age using regular expression, keeping the units: "53 Yrs 11 Mon 1 Days"
+    age_match = re.search(r'(Age|AGE)\s*:\s*(\d+(?:[ \t]*(?:Yrs?|Years?|Mon(?:ths?)?|Days?)\b(?:[ \t]*\d+)?)*)', text, re.IGNORECASE)
+    patient_age = age_match.group(2).strip() if age_match else AGE_NOT_FOUND
+
+    # Extract test date/time
+    date_time_match = re.search(r'Preliminary date/time\s*:\s*(\d{2}-[A-Z]{3}-\d{2} \d{2}:\d{2}:\d{2} [APM]{2})', text, re.IGNORECASE)
+    test_date_time = date_time_match.group(1).strip() if date_time_match else DATE_NOT_FOUND
+
+    return patient_name, patient_age, test_date_time
+
+
+# Extract the patient's sex ("Gender :Female", some reports omit the colon) from the report text.
+# Only Male/Female count: some layouts put another label right after "Gender".
+def parse_patient_sex(text):
+    gender_match = re.search(r'Gender\s*:?\s*(Male|Female)\b', text, re.IGNORECASE)
+    return gender_match.group(1).strip() if gender_match else SEX_NOT_FOUND
+
+
+# Read the results table of a report with tabula.
+# Returns ({'Unnamed: 0' label: 'Result'}, None) or (None, error message).
+def extract_results(file_path):
+    _, tabula = load_extraction_libs()
+    tables = tabula.read_pdf(file_path, pages='all', multiple_tables=True)
+    if not tables:
+        return None, "No tables found in the PDF"
+
+    df = tables[0]
+
+    # Drop rows where 'Result' is NaN
+    df_filtered = df.dropna(subset=['Result'])
+
+    if 'Unnamed: 0' not in df.columns:
+        return None, "'Unnamed: 0' column not found in the DataFrame"
+
+    # Drop rows where 'Unnamed: 0' is NaN
+    df_filtered = df_filtered.dropna(subset=['Unnamed: 0'])
+
+    # Create a mapping from 'Unnamed: 0' to 'Result'
+    return df_filtered.set_index('Unnamed: 0')['Result'].to_dict(), None
+
+
+# Fields derived from a report: patient details from the first-page text, the
+# results table, and its reference-range flags (shared by process_pdf and reextract-uploads)
+def report_fields(text, results):
+    from reference_ranges import flag_results, flag_summary
+    patient_name, patient_age, test_date_time = parse_patient_details(text)
+    patient_sex = parse_patient_sex(text)
+    fields = {
+        'patient-name': patient_name,
+        'patient-age': patient_age,
+        'test-date-time': test_date_time,
+        'patient-sex': patient_sex,
+    }
+    fields.update(results)
+    fields.update(flag_summary(flag_results(results, patient_sex, patient_age)))
+
+    # Normalised name, age, test types and date for /api/patient-search
+    from patient_search import search_fields
+    fields.update(search_fields(fields, set(REPORT_METADATA_FIELDS)))
+    return fields
+
+
+# Extraction job for reextract-uploads: the full report_fields of a stored PDF
+def rederive_report(file_path):
+    pdfplumber, _ = load_extraction_libs()
+    with pdfplumber.open(file_path) as pdf:
+        text = pdf.pages[0].extract_text() or ''
+    results, error = extract_results(file_path)
+    if error:
+        return None, error
+    return report_fields(text, results), None
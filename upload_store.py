@@ -0,0 +1,149 @@
+import contextlib
+import gzip
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+# Content-addressed store for uploaded report PDFs.
+#
+# Blobs are named by the SHA-256 of their bytes and sharded into two levels of
+# sub-directories (uploads/blobs/ab/cd/abcd...), so identical uploads are stored
+# once, names never collide and no directory grows past a few hundred entries.
+# Blobs can optionally be gzip-compressed on disk; the hash is always of the
+# original bytes.
+
+CHUNK_SIZE = 1024 * 1024
+GZIP_SUFFIX = '.gz'
+
+
+class UploadStore:
+    def __init__(self, root, compress=False):
+        self.root = root
+        self.compress = compress
+        self.tmp_dir = os.path.join(root, 'tmp')
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    # uploads/blobs/ab/cd/<digest>
+    def _blob_path(self, digest):
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    # Path of an existing blob (compressed or not), or None
+    def find(self, digest):
+        path = self._blob_path(digest)
+        for candidate in (path, path + GZIP_SUFFIX):
+            if os.path.exists(candidate):
+                return candidate
+        return None
+
+    # Stream a file object into the store and return the hex digest of its bytes
+    def put(self, stream):
+        hasher = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as raw:
+                out = gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6) if self.compress else raw
+                try:
+                    while True:
+                        chunk = stream.read(CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        hasher.update(chunk)
+                        out.write(chunk)
+                finally:
+                    if out is not raw:
+                        out.close()
+
+            digest = hasher.hexdigest()
+            existing = self.find(digest)
+            if existing:
+                # Duplicate upload: keep the stored copy and refresh its age for the GC
+                os.utime(existing)
+                os.remove(tmp_path)
+                return digest
+
+            target = self._blob_path(digest) + (GZIP_SUFFIX if self.compress else '')
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(tmp_path, target)
+            return digest
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    # Yield a plain file path for the blob (decompressing to a temp file if needed)
+    @contextlib.contextmanager
+    def local_path(self, digest):
+        path = self.find(digest)
+        if path is None:
+            raise FileNotFoundError(f"No stored upload with hash {digest}")
+        if not path.endswith(GZIP_SUFFIX):
+            yield path
+            return
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir, suffix='.pdf')
+        try:
+            with os.fdopen(fd, 'wb') as out, gzip.open(path, 'rb') as src:
+                shutil.copyfileobj(src, out, CHUNK_SIZE)
+            yield tmp_path
+        finally:
+            os.remove(tmp_path)
+
+    # All stored digests with their on-disk paths
+    def iter_blobs(self):
+        for shard in os.listdir(self.root):
+            shard_dir = os.path.join(self.root, shard)
+            if shard == 'tmp' or not os.path.isdir(shard_dir):
+                continue
+            for sub in os.listdir(shard_dir):
+                sub_dir = os.path.join(shard_dir, sub)
+                for name in os.listdir(sub_dir):
+                    yield name[:-len(GZIP_SUFFIX)] if name.endswith(GZIP_SUFFIX) else name, os.path.join(sub_dir, name)
+
+    # Delete blobs nobody references once they are older than min_age seconds.
+    # The age check keeps blobs whose report is still being extracted.
+    def collect_garbage(self, referenced, min_age):
+        now = time.time()
+        removed = 0
+        freed = 0
+        for digest, path in list(self.iter_blobs()):
+            if digest in referenced:
+                continue
+            try:
+                stat = os.stat(path)
+                if now - stat.st_mtime < min_age:
+                    continue
+                os.remove(path)
+                removed += 1
+                freed += stat.st_size
+            except FileNotFoundError:
+                continue
+
+        # Leftovers from interrupted uploads
+        for name in os.listdir(self.tmp_dir):
+            path = os.path.join(self.tmp_dir, name)
+            with contextlib.suppress(FileNotFoundError):
+                if now - os.stat(path).st_mtime >= min_age:
+                    os.remove(path)
+
+        return {"removed": removed, "bytesFreed": freed}
+
+
+# Run collect_garbage every `interval` seconds on a daemon thread.
+# `referenced_hashes` is called each pass to get the set of digests still in use.
+def start_gc_thread(store, referenced_hashes, interval, min_age):
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                stats = store.collect_garbage(referenced_hashes(), min_age)
+                if stats['removed']:
+                    print(f"Upload GC: removed {stats['removed']} blobs, freed {stats['bytesFreed']} bytes")
+            except Exception as e:
+                print(f"Upload GC error: {e}")
+
+    thread = threading.Thread(target=loop, name='upload-gc', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,187 @@
+import atexit
+import os
+import threading
+import time
+
+from bson import ObjectId, json_util
+from pymongo.errors import BulkWriteError, PyMongoError
+from pymongo.write_concern import WriteConcern
+
+# Write-behind buffer for high-rate inserts.
+#
+# Documents get a client-generated ObjectId and are queued; a background thread
+# writes them with unordered insert_many once `max_batch` documents are waiting
+# or the oldest one has waited `max_delay` seconds. The caller gets the _id back
+# immediately. Pending documents are flushed on interpreter exit.
+#
+# A batch the database still refuses after MAX_RETRIES attempts goes back to
+# the front of the queue for the next cycle. Documents the database rejects
+# outright, documents beyond `max_pending` while it is unreachable, and
+# whatever is still unwritten at exit are appended to `spill_path` as extended
+# JSON lines instead of being dropped (see replay_spilled()).
+
+MAX_RETRIES = 3
+
+
+class WriteBehindBuffer:
+    def __init__(self, collection, max_batch=100, max_delay=0.5, write_concern=None, max_pending=10000, spill_path=None):
+        if write_concern is not None:
+            collection = collection.with_options(write_concern=WriteConcern(**write_concern))
+        self.collection = collection
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.spill_path = spill_path
+        self._spill_lock = threading.Lock()
+        self._pending = []
+        self._oldest = None
+        self._cond = threading.Condition()
+        self._closed = False
+        self.stats = {"queued": 0, "written": 0, "batches": 0, "failed": 0, "requeued": 0, "spilled": 0}
+        self._thread = threading.Thread(target=self._run, name=f'write-behind-{collection.name}', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # Queue a copy of the document (callers keep editing theirs for the response) and return its _id
+    def add(self, document):
+        document = dict(document)
+        document.setdefault('_id', ObjectId())
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Write-behind buffer is closed")
+            if not self._pending:
+                self._oldest = time.monotonic()
+            self._pending.append(document)
+            self.stats['queued'] += 1
+            # Wake the writer to start the delay timer, or to write a full batch now
+            if len(self._pending) == 1 or len(self._pending) >= self.max_batch:
+                self._cond.notify()
+        return document['_id']
+
+    def _take_batch(self):
+        batch = self._pending[:self.max_batch]
+        del self._pending[:self.max_batch]
+        self._oldest = time.monotonic() if self._pending else None
+        return batch
+
+    # Append documents to the spill file (or, without one, count them as lost)
+    def _spill(self, documents, reason):
+        if not documents:
+            return
+        if not self.spill_path:
+            self.stats['failed'] += len(documents)
+            print(f"Write-behind: dropped {len(documents)} documents for {self.collection.name} ({reason}), no spill file configured")
+            return
+        try:
+            with self._spill_lock:
+                directory = os.path.dirname(self.spill_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.spill_path, 'a') as f:
+                    for document in documents:
+                        f.write(json_util.dumps(document) + '\n')
+            self.stats['spilled'] += len(documents)
+            print(f"Write-behind: spilled {len(documents)} documents for {self.collection.name} to {self.spill_path} ({reason})")
+        except OSError as e:
+            self.stats['failed'] += len(documents)
+            print(f"Write-behind: could not spill {len(documents)} documents to {self.spill_path}: {e}")
+
+    # Insert a batch; returns the documents still to be written when the database stayed unreachable
+    def _write(self, batch):
+        for attempt in range(1, MAX_RETRIES + 1):
+            try:
+                self.collection.insert_many(batch, ordered=False)
+                self.stats['written'] += len(batch)
+                self.stats['batches'] += 1
+                return []
+            except BulkWriteError as e:
+                # Duplicate _ids were already written by an earlier attempt; anything else won't go in on a retry
+                errors = [err for err in e.details.get('writeErrors', []) if err.get('code') != 11000]
+                self.stats['written'] += e.details.get('nInserted', 0)
+                self.stats['batches'] += 1
+                if errors:
+                    print(f"Write-behind: {len(errors)} documents rejected by {self.collection.name}: {errors[0].get('errmsg')}")
+                    self._spill([batch[err['index']] for err in errors], 'rejected')
+                return []
+            except PyMongoError as e:
+                print(f"Write-behind: insert into {self.collection.name} failed (attempt {attempt}/{MAX_RETRIES}): {e}")
+                time.sleep(min(2 ** attempt * 0.1, 2))
+        return batch
+
+    # Put an unwritten batch back at the front of the queue; what doesn't fit is spilled
+    def _requeue(self, batch):
+        if not batch:
+            return
+        with self._cond:
+            if self._closed:
+                overflow = batch
+            else:
+                self._pending[:0] = batch
+                self._oldest = time.monotonic()
+                self.stats['requeued'] += len(batch)
+                overflow = self._pending[self.max_pending:]
+                del self._pending[self.max_pending:]
+        self._spill(overflow, 'database unavailable')
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed:
+                    if len(self._pending) >= self.max_batch:
+                        break
+                    if self._pending and time.monotonic() - self._oldest >= self.max_delay:
+                        break
+                    timeout = self.max_delay - (time.monotonic() - self._oldest) if self._pending else None
+                    self._cond.wait(timeout)
+                if self._closed and not self._pending:
+                    return
+                batch = self._take_batch()
+            self._requeue(self._write(batch))
+
+    # Write everything queued so far before returning; what still can't be written is spilled
+    def flush(self):
+        while True:
+            with self._cond:
+                batch = self._take_batch()
+            if not batch:
+                return
+            unwritten = self._write(batch)
+            if unwritten:
+                with self._cond:
+                    unwritten += self._pending
+                    self._pending = []
+                    self._oldest = None
+                self._spill(unwritten, 'database unavailable')
+                return
+
+    # Counters plus the number of documents waiting to be written
+    def snapshot(self):
+        with self._cond:
+            return dict(self.stats, pending=len(self._pending))
+
+    def close(self):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        self.flush()
+
+
+# Insert the documents of a spill file into `collection`; returns (inserted, rejected).
+# The file is removed once everything in it is stored (duplicates count as stored).
+def replay_spilled(collection, path, batch_size=1000):
+    with open(path) as f:
+        documents = [json_util.loads(line) for line in f if line.strip()]
+    inserted = rejected = 0
+    for start in range(0, len(documents), batch_size):
+        batch = documents[start:start + batch_size]
+        try:
+            inserted += len(collection.insert_many(batch, ordered=False).inserted_ids)
+        except BulkWriteError as e:
+            inserted += e.details.get('nInserted', 0)
+            rejected += len([err for err in e.details.get('writeErrors', []) if err.get('code') != 11000])
+    if not rejected:
+        os.remove(path)
+    return inserted, rejected